@@ -0,0 +1,60 @@
+"""Compare clean_df with the previous whole-frame regex cleaning.
+
+    python -m benchmarks.bench_clean_df [votedata_dir]
+
+Without arguments a synthetic election is generated in a temporary directory.
+"""
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from tw_politicians_bot.clean_df import clean_df
+
+from .synthetic_votedata import write_synthetic_election
+
+
+def legacy_clean_df(df: pd.DataFrame):
+    df.replace('^\'*', '', regex=True, inplace=True)
+    for col in df.columns:
+        if type(col[0]) == str:
+            df[col] = df[col].str.strip()
+
+
+HEADERS = {
+    'elbase.csv': ['省市', '縣市', '選區', '鄉鎮市區', '村里', '名稱'],
+    'elcand.csv': ['省市', '縣市', '選區', '鄉鎮市區', '村里', '號次',
+                   '名字', '政黨編號', '性別', '出生日期', '年齡', '出生地',
+                   '學歷', '現任', '當選註記', '副手'],
+    'elctks.csv': ['省市', '縣市', '選區', '鄉鎮市區', '村里', '投開票所', '號次', '得票數', '得票率', '當選註記'],
+}
+
+
+def timeit(func, df, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best, frame
+
+
+def run(dir_name):
+    for filename, header in HEADERS.items():
+        df = pd.read_csv(f'{dir_name}/{filename}', names=header, dtype=str)
+        legacy_time, legacy = timeit(legacy_clean_df, df)
+        fast_time, fast = timeit(clean_df, df)
+        assert legacy.equals(fast), f'{filename}: results differ'
+        print(f'{filename} ({df.shape[0]:>8} rows)  legacy {legacy_time:7.3f} s  '
+              f'clean_df {fast_time:7.3f} s  ({legacy_time / fast_time:5.1f} x)')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        run(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_synthetic_election(tmp_dir, townships=300, villages=30, stations=6, candidates=5)
+            run(tmp_dir)
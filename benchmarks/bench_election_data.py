@@ -0,0 +1,102 @@
+"""Compare ElectionData with the per-row loader of the baseline (baseline_election_data).
+
+    python -m benchmarks.bench_election_data [votedata_dir district_type]
+
+Without arguments a large synthetic election is generated in a temporary directory.
+"""
+import functools
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pywikibot import WbTime
+
+from tw_politicians_bot.election_data import ElectionData
+from tw_politicians_bot.wb_time_utils import encode_wbtime
+
+from . import baseline_election_data
+from .synthetic_votedata import write_synthetic_election
+
+
+class OfflineSite():
+    """Just enough of a data repository for WbTime, so the baseline loader needs no network."""
+
+    def calendarmodel(self):
+        return 'http://www.wikidata.org/entity/Q1985727'
+
+    def data_repository(self):
+        return self
+
+
+# The baseline builds WbTime without a site, which would log in to Wikidata
+baseline_election_data.WbTime = functools.partial(WbTime, site=OfflineSite())
+
+
+def timeit(func, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def retained_memory(func) -> int:
+    """Bytes still allocated while the result of func() is alive, as traced by tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def summarize(candidates):
+    return sorted((key, cand.legal_name, cand.votes, str(cand.district), cand.birth_date_value, cand.birth_date_precision)
+                  for key, cand in candidates.items())
+
+
+def summarize_baseline(candidates):
+    return sorted((key, cand.legal_name, cand.votes, str(cand.district), *encode_wbtime(cand.birth_date))
+                  for key, cand in candidates.items())
+
+
+def run(dir_name, district_type):
+    baseline_time, baseline = timeit(lambda: baseline_election_data.ElectionData(dir_name, district_type))
+    load_time, data = timeit(lambda: ElectionData(dir_name, district_type, cache=False))
+    stream_time, streamed = timeit(lambda: ElectionData(dir_name, district_type, chunksize=100_000, cache=False))
+    data.cache_path.unlink(missing_ok=True)
+    ElectionData(dir_name, district_type)  # writes the cache
+    cached_time, cached = timeit(lambda: ElectionData(dir_name, district_type))
+
+    assert summarize_baseline(baseline.candidates) == summarize(data.candidates), 'loaders disagree'
+    assert summarize(data.candidates) == summarize(streamed.candidates), 'streaming loader disagrees'
+    assert summarize(data.candidates) == summarize(cached.candidates), 'cached tables disagree'
+
+    baseline_memory = retained_memory(lambda: baseline_election_data.ElectionData(dir_name, district_type))
+    memory = retained_memory(lambda: ElectionData(dir_name, district_type, cache=False))
+
+    print(f'candidates:                 {len(data.candidates)}')
+    print(f'baseline loader memory:     {baseline_memory / 1e6:8.3f} MB')
+    print(f'ElectionData memory:        {memory / 1e6:8.3f} MB')
+    print(f'baseline loader:            {baseline_time:8.3f} s')
+    print(f'vectorized:                 {load_time:8.3f} s')
+    print(f'streamed elctks:            {stream_time:8.3f} s')
+    print(f'cached:                     {cached_time:8.3f} s')
+    print(f'speedup:                    {baseline_time / load_time:8.1f} x')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        run(sys.argv[1], sys.argv[2])
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_synthetic_election(tmp_dir, townships=300, villages=30, stations=6, candidates=5)
+            run(tmp_dir, '其他')
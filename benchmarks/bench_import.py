@@ -0,0 +1,54 @@
+"""Measure how long importing the package takes in a fresh interpreter.
+
+    python -m benchmarks.bench_import [module ...]
+
+Each module is imported in new processes (`python -X importtime`); the best wall time
+is reported with the heaviest dependencies, and the number of pywikibot sites the
+import created, which should be 0.
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+
+DEFAULT_MODULES = ['tw_politicians_bot', 'tw_politicians_bot.votedata']
+DEPENDENCIES = ['pywikibot', 'pandas', 'numpy', 'tkinter', 'wikidataintegrator']
+
+CODE = 'import {module}, pywikibot; print(len(pywikibot._sites))'
+
+
+def import_times(stderr:str):
+    """Cumulative import time (ms) of every module in `python -X importtime` output."""
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def run(module, repeat=5):
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE.format(module=module)],
+                                capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            print(result.stderr.splitlines()[-1])
+            return
+
+    times = import_times(result.stderr)
+    print(f'{module}')
+    print(f'    wall (best of {repeat}) {min(walls) * 1000:8.1f} ms   median {statistics.median(walls) * 1000:8.1f} ms')
+    print(f'    {module:<20}{times.get(module, 0):8.1f} ms')
+    for dependency in DEPENDENCIES:
+        print(f'      {dependency:<18}{times.get(dependency, 0):8.1f} ms')
+    print(f'    sites created       {result.stdout.strip():>8}')
+
+
+if __name__ == '__main__':
+    for module in sys.argv[1:] or DEFAULT_MODULES:
+        run(module)
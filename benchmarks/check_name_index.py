@@ -0,0 +1,51 @@
+"""Build a name index from the small fixture dump and check what it keeps.
+
+    python -m benchmarks.check_name_index
+
+The fixture (fixtures/name_index_dump.json.gz) is cut off like an interrupted download:
+its last entity line still ends with a comma, the array is never closed, and the line
+after it is torn in the middle of an entity.
+"""
+import os
+import tempfile
+
+from tw_politicians_bot.matching import GENDER_FEMALE, GENDER_MALE, NATIONALITY_NONE, NATIONALITY_TAIWAN
+from tw_politicians_bot.name_index import NameIndex, build_name_index
+from tw_politicians_bot.wb_time_utils import encode_date
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'name_index_dump.json.gz')
+
+
+def check():
+    with tempfile.TemporaryDirectory() as dir_name:
+        index_filename = os.path.join(dir_name, 'name_index.sqlite')
+        index = build_name_index(FIXTURE, index_filename)
+        # Humans with a zh-tw or zh-hant label only: not the non-human, the English-only
+        # human, the property, nor the torn entity
+        assert len(index) == 2, len(index)
+        index.close()
+
+        index = NameIndex(index_filename)
+        found = index.lookup_many(['王小明', '陳美玲', '林志明', 'John Smith'])
+
+        [wang] = found['王小明']
+        assert wang.id == 'Q900001', wang
+        assert wang.human and wang.politician and not wang.party
+        assert (wang.birth_date, wang.birth_precision) == (encode_date(1960, 5, 20), 11), wang
+        assert wang.gender == GENDER_MALE and wang.nationality == NATIONALITY_TAIWAN, wang
+
+        [chen] = found['陳美玲']     # zh-hant label only
+        assert chen.id == 'Q900002', chen
+        assert (chen.birth_date, chen.birth_precision) == (encode_date(1975, 0, 0), 9), chen
+        assert chen.gender == GENDER_FEMALE and chen.nationality == NATIONALITY_NONE, chen
+
+        assert found['林志明'] == [], found['林志明']
+        assert found['John Smith'] == [], found['John Smith']
+        assert index.lookup('王小明') == [wang]
+        index.close()
+    print('name index OK')
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,40 @@
+"""Check that main gets past "Loading data" with the shipped PartyID-EntityID.csv.
+
+    python -m benchmarks.check_party_mapping [PartyID-EntityID.csv] [--online]
+
+The mapping is loaded as main loads it; every value must be an entity ID that
+AdaptiveEntity.adapt_many accepts or be empty (parties without an entity, which are
+left out of the bulk adaptation). With --online, load_parties also runs against
+Wikidata (main site, so nothing is created) and every mapped party must be interned.
+"""
+import os
+import sys
+
+import tw_politicians_bot as bot
+from tw_politicians_bot.entity_registry import DEFAULT_REGISTRY, ENTITY_ID_REGEX
+
+
+DEFAULT_FILENAME = os.path.join(os.path.dirname(__file__), os.pardir, 'PartyID-EntityID.csv')
+
+
+def check(filename=DEFAULT_FILENAME, online=False):
+    bot.entity_id_of_party.clear()
+    bot.load_party_mapping(filename)
+    assert 'PartyID' not in bot.entity_id_of_party, 'header row loaded as a party'
+    mapped = {party: id for party, id in bot.entity_id_of_party.items() if id != ''}
+    bad = {party: id for party, id in mapped.items() if not ENTITY_ID_REGEX.fullmatch(id)}
+    assert not bad, f'not entity IDs: {bad}'
+    print(f'{len(bot.entity_id_of_party)} parties loaded, {len(mapped)} with an entity')
+
+    if online:
+        site = bot.main_site()
+        bot.load_parties(site, filename)
+        missing = [id for id in mapped.values() if (site.sitename, 'adapted', id) not in DEFAULT_REGISTRY.pages]
+        assert not missing, f'not interned: {missing}'
+        print(f'{len(mapped)} parties interned on {site.sitename}')
+    print('party mapping OK')
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '--online']
+    check(*args, online='--online' in sys.argv[1:])
@@ -0,0 +1,57 @@
+"""Write synthetic elbase/elcand/elctks files shaped like the CEC votedata ones.
+
+The generated election is a township-level one: candidates run in every
+township, and elctks.csv holds the township totals followed by one row per
+polling station (投開票所) and candidate, which is what makes the real files big.
+"""
+import csv
+import random
+from pathlib import Path
+
+
+def _quote(value):
+    # CEC files prefix code columns with an apostrophe
+    return f"'{value}"
+
+
+def write_synthetic_election(dir_name, townships=100, villages=20, stations=5, candidates=4, seed=0):
+    rng = random.Random(seed)
+    path = Path(dir_name)
+    path.mkdir(parents=True, exist_ok=True)
+
+    province, county, district = '63', '000', '00'
+
+    with open(path/'elbase.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([_quote(province), _quote(county), _quote(district), _quote('000'), _quote('0000'), '臺北市'])
+        for t in range(1, townships + 1):
+            township = f'{t:03d}'
+            writer.writerow([_quote(province), _quote(county), _quote(district), _quote(township), _quote('0000'),
+                             f'第{t}區'])
+            for v in range(1, villages + 1):
+                writer.writerow([_quote(province), _quote(county), _quote(district), _quote(township),
+                                 _quote(f'{v:04d}'), f'第{t}區第{v}里'])
+
+    with open(path/'elcand.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for t in range(1, townships + 1):
+            for n in range(1, candidates + 1):
+                birth = f'{rng.randint(20, 80):03d}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'
+                writer.writerow([_quote(province), _quote(county), _quote(district), _quote(f'{t:03d}'),
+                                 _quote('0000'), n, f'候選人{t}之{n}', rng.choice(['1', '2', '16', '999']),
+                                 rng.choice([1, 2]), birth, 50, '臺北市', '大學', 'N', ' ', 'N'])
+
+    with open(path/'elctks.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for t in range(1, townships + 1):
+            township = f'{t:03d}'
+            for n in range(1, candidates + 1):
+                writer.writerow([_quote(province), _quote(county), _quote(district), _quote(township),
+                                 _quote('0000'), 0, n, rng.randint(1000, 90000), '25.00', ' '])
+            for v in range(1, villages + 1):
+                for s in range(1, stations + 1):
+                    for n in range(1, candidates + 1):
+                        writer.writerow([_quote(province), _quote(county), _quote(district), _quote(township),
+                                         _quote(f'{v:04d}'), s, n, rng.randint(0, 900), '25.00', ' '])
+
+    return path
@@ -6,8 +6,25 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-t', '--test', type=str, default=True, help='False to turn off test mode, default: True')
     parser.add_argument('-n', type=int, default=-1, help='Import first n candidates only')
-    parser.add_argument('-s', '--sleep', type=float, default=1, help='Sleep time in seconds for each write operation')
+    parser.add_argument('-s', '--sleep', type=float, default=1, help='Longest wait in seconds between write operations; shorter while the server keeps up')
+    parser.add_argument('-c', '--chunksize', type=int, default=None, help='Read elctks.csv in chunks of this many rows to bound memory')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of candidates to search and fetch concurrently')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the parsed election data cache')
+    parser.add_argument('--no-entity-store', action='store_true', help='Fetch every entity from the API instead of entity_store.sqlite')
+    parser.add_argument('--no-search-cache', action='store_true', help='Always call the search API instead of search_cache.sqlite')
+    parser.add_argument('--search-cache-ttl', type=float, default=7, help='Days before a cached search is repeated, default: 7')
+    parser.add_argument('--name-index', type=str, default=None, help='Match candidates offline with a name index built by tw_politicians_bot.name_index')
+    parser.add_argument('--stream', action='store_true', help='Write each candidate as soon as it is prepared, without the confirmation menu')
+    parser.add_argument('--queue-size', type=int, default=20, help='With --stream, the most prepared candidates waiting to be written')
+    parser.add_argument('--journal', type=str, default='import_journal.jsonl', help='File recording match decisions and writes of the import, default: import_journal.jsonl')
+    parser.add_argument('--resume', action='store_true', help='Continue the import recorded in the journal: skip written candidates and reuse match decisions')
+    parser.add_argument('--district-ids', type=str, default=None, help='CSV file keeping 區域立委 district name -> Wikidata ID across runs')
     args = parser.parse_args()
 
     args.test = bool(strtobool(str(args.test)))
-    tw_politicians_bot.main(is_test=args.test, head=args.n, sleep_time=args.sleep)
+    tw_politicians_bot.main(is_test=args.test, head=args.n, sleep_time=args.sleep, chunksize=args.chunksize,
+                            cache=not args.no_cache, workers=args.workers,
+                            use_entity_store=not args.no_entity_store, name_index_file=args.name_index,
+                            use_search_cache=not args.no_search_cache, search_cache_ttl=args.search_cache_ttl*24*3600,
+                            stream=args.stream, queue_size=args.queue_size, district_mapping_file=args.district_ids,
+                            journal_file=args.journal, resume=args.resume)
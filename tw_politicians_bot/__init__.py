@@ -1,46 +1,51 @@
-import copy
 import code
 import os
-import tkinter as tk
-import tkinter.filedialog
 import itertools
-from typing import List, Dict, Tuple
-import time
+from typing import List, Dict, Optional, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
 import csv
+import json
 from dataclasses import dataclass
+from functools import lru_cache
 
 from pywikibot import (
-    Site,
     ItemPage,
     Claim,
     WbTime,
     WbQuantity,
 )
 from pywikibot.site import DataSite
-from pywikibot.data.api import LoginManager
 from pywikibot.page._collections import (
     LanguageDict,
     ClaimCollection,
 )
 
-from wikidataintegrator import wdi_core
-
 from .election_data import ElectionData, Gender, District, Candidate
 from .entity_ids import ItemIds, PropertyIds
-from .wb_time_utils import WbTimePrecision, time_match
+from .wb_time_utils import WbTimePrecision, encode_wbtime, dates_match
 from .get_label import get_zhtw_label
-from .adaptive_entity import AdaptiveEntity
+from .sites import main_site, test_site
+from .entity_registry import DEFAULT_REGISTRY, interned_item, interned_adaptive_entity, intern_adaptive_entities
+from . import entity_store
+from .search_cache import search_entities, open_default_cache, forget_searches
+from .district_index import default_district_index
+from .matching import MatchTable, features_confidence, page_features
+from .name_index import NameIndex
+from .import_journal import ImportJournal, candidate_key
 from .wd_utils import (
     make_claim,
-    find_claim,
     set_claim,
+    fetch_entities,
+    add_sources,
 )
-from .utils import options_interface
+from .utils import options_interface, batched
+from .write_scheduler import WriteScheduler, outcome_unknown
 
 # Constants
 NO_PARTY = '999'
 REFERENCE_URL = 'https://data.gov.tw/dataset/13119'
-DATA_RETRIEVED_TIME = WbTime.fromTimestr('+2020-09-07T00:00:00Z', WbTimePrecision.DAY)
 WD_URL = 'https://www.wikidata.org'
 WD_API_URL = 'https://www.wikidata.org/w/api.php'
 TEST_WD_URL = 'https://test.wikidata.org'
@@ -49,10 +54,28 @@ TEST_WD_API_URL = 'https://test.wikidata.org/w/api.php'
 ELECTORAL_DISTRICT_OPTIONS = ['行政區', '區域立委', '山地立委', '平地立委', '其他']
 ELECTION_ID_FILENAME = 'election_id.csv'
 
-WD_SITE: DataSite = Site('wikidata', 'wikidata')
-TEST_WD_SITE: DataSite = Site('test', 'wikidata')
+# Constants that need a site are created on first use (see __getattr__), so that
+# importing the package stays cheap for tools and worker processes.
+
+@lru_cache(maxsize=None)
+def data_retrieved_time() -> WbTime:
+    return WbTime.fromTimestr('+2020-09-07T00:00:00Z', precision=WbTimePrecision.DAY, site=main_site())
+
+@lru_cache(maxsize=None)
+def main_property_ids() -> PropertyIds:
+    return PropertyIds(main_site())
 
-MAIN_P = PropertyIds(WD_SITE)
+_LAZY_CONSTANTS = {
+    'WD_SITE': main_site,
+    'TEST_WD_SITE': test_site,
+    'MAIN_P': main_property_ids,
+    'DATA_RETRIEVED_TIME': data_retrieved_time,
+}
+
+def __getattr__(name):
+    if name in _LAZY_CONSTANTS:
+        return _LAZY_CONSTANTS[name]()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 IS_TEST = True
 SITE_URL = ''
@@ -62,12 +85,35 @@ SITE = None
 P = None
 Q = None
 
-ModificationList = List[Tuple[ItemPage, Dict]]
+
+@dataclass
+class ItemModification():
+    """The modified data of an item, with the JSON of the item as it was fetched (None for new items).
+
+    `changed` is False when the data is the same as the fetched item, which is then not written.
+    Unpacks as (item, data).
+    """
+    item: ItemPage
+    data: Dict
+    original: Optional[Dict] = None
+    key: Optional[str] = None   # candidate_key, for the import journal
+    changed: bool = True
+
+    def __iter__(self):
+        return iter((self.item, self.data))
+
+
+ModificationList = List[ItemModification]
 
 
-def main(is_test=True, head=-1, sleep_time=0):
+def main(is_test=True, head=-1, sleep_time=0, chunksize=None, cache=True, workers=1, use_entity_store=True,
+         name_index_file=None, use_search_cache=True, search_cache_ttl=7*24*3600, stream=False, queue_size=20,
+         district_mapping_file=None, journal_file=None, resume=False):
 
-    initialize(is_test)
+    initialize(is_test, use_entity_store, use_search_cache, search_cache_ttl)
+
+    import tkinter as tk
+    import tkinter.filedialog
 
     root = tk.Tk()
     root.overrideredirect(True)
@@ -120,15 +166,16 @@ def main(is_test=True, head=-1, sleep_time=0):
             except OSError:
                 print(f'找不到 {ELECTION_ID_FILENAME}，要協助創建嗎？')
                 if input('(Y/N): ').upper() == 'Y':
-                    election_id_create_interface(dir_name, district_type)
+                    election_id_create_interface(dir_name, district_type, chunksize, cache)
                 continue
             except Exception as err:
                 print(f'{err}')
                 print(f'關於 {ELECTION_ID_FILENAME} 請參閱說明文件')
                 continue
+            intern_adaptive_entities(SITE, election_item_id_of_district.values())
             break
 
-        election_item = AdaptiveEntity(SITE, input_election_item_id)
+        election_item = interned_adaptive_entity(SITE, input_election_item_id)
         print()
         print(f'    {get_zhtw_label(election_item)} ({election_item.concept_uri()})')
         print()
@@ -142,18 +189,61 @@ def main(is_test=True, head=-1, sleep_time=0):
 
     # Load Data
     print('Loading data')
-    load_party_mapping(party_entity_mapping_file)
-    election_data = ElectionData(dir_name, district_type)
+    load_parties(SITE, party_entity_mapping_file)
+    election_data = ElectionData(dir_name, district_type, chunksize=chunksize, cache=cache)
     print(f'已載入 {len(election_data.candidates)} 筆候選人資料')
     print('-----------------------------')
 
-    items_data = prepare_candidate_items_data(SITE, election_data, district_type, election_item, head)
+    if district_mapping_file is not None and os.path.isfile(district_mapping_file):
+        load_legislative_district_mapping(district_mapping_file)
+
+    journal = None
+    if journal_file is not None:
+        run = {'site': SITE.sitename, 'source': os.path.abspath(dir_name), 'district_type': district_type,
+               'election': None if election_item is None else election_item.getID()}
+        journal = ImportJournal(journal_file, run, resume=resume)
+        resolve_unconfirmed_writes(SITE, journal)
+
+    name_index = None
+    if name_index_file is not None:
+        if IS_TEST:
+            print(f'測試模式不使用 {name_index_file}（索引內為 Wikidata 主站的 ID）')
+        else:
+            name_index = NameIndex(name_index_file)
+
+    if stream:
+        print('開始匯入（邊準備邊寫入）')
+        items_data = iter_candidate_items_data(SITE, election_data, district_type, election_item, head, workers,
+                                               name_index=name_index, journal=journal)
+        try:
+            new_item_count, modify_item_count, unchanged_item_count, failed_item_count = \
+                stream_candidates_data(items_data, sleep_time, queue_size, journal)
+        finally:
+            if journal is not None:
+                journal.close()
+        if district_mapping_file is not None:
+            save_legislative_district_mapping(district_mapping_file)
+        print('-----------------------------')
+        print(f'新增: {new_item_count}')
+        print(f'修改: {modify_item_count}')
+        print(f'未變更: {unchanged_item_count}')
+        print(f'失敗: {failed_item_count}')
+        print(DEFAULT_REGISTRY)
+        return
+
+    items_data = prepare_candidate_items_data(SITE, election_data, district_type, election_item, head, workers,
+                                              name_index=name_index, journal=journal)
+    if district_mapping_file is not None:
+        save_legislative_district_mapping(district_mapping_file)
 
     print('-----------------------------')
     new_item_count = sum(1 for (item, _) in items_data if item.getID() == '-1')
-    modify_item_count = len(items_data) - new_item_count
+    unchanged_item_count = sum(1 for modification in items_data if not modification.changed)
+    modify_item_count = len(items_data) - new_item_count - unchanged_item_count
     print(f'新增: {new_item_count}')
     print(f'修改: {modify_item_count}')
+    print(f'未變更: {unchanged_item_count}')
+    print(DEFAULT_REGISTRY)
 
     while True:
         print('-----------------------------')
@@ -165,7 +255,11 @@ def main(is_test=True, head=-1, sleep_time=0):
         action = input('Action: ').upper()
         if action == 'S':
             print('開始匯入')
-            write_candidates_data(items_data, sleep_time)
+            try:
+                write_candidates_data(items_data, sleep_time, journal)
+            finally:
+                if journal is not None:
+                    journal.close()
             break
         if action == 'C':
             print('取消匯入')
@@ -176,10 +270,12 @@ def main(is_test=True, head=-1, sleep_time=0):
         if action == 'D':
             code.interact(local=dict(globals(), **locals()))
 
+    if journal is not None:
+        journal.close()
     code.interact(local=dict(globals(), **locals()))
 
 
-def initialize(is_test=True):
+def initialize(is_test=True, use_entity_store=True, use_search_cache=True, search_cache_ttl=7*24*3600):
     global IS_TEST
     global SITE_URL
     global API_URL
@@ -189,11 +285,11 @@ def initialize(is_test=True):
 
     IS_TEST = is_test
     if IS_TEST:
-        SITE = TEST_WD_SITE
+        SITE = test_site()
         SITE_URL = TEST_WD_URL
         API_URL = TEST_WD_API_URL
     else:
-        SITE = WD_SITE
+        SITE = main_site()
         SITE_URL = WD_URL
         API_URL = WD_API_URL
 
@@ -202,10 +298,16 @@ def initialize(is_test=True):
     if WDPASS is None:
         raise ValueError('Environment variable "WDPASS" is required.')
 
+    from pywikibot.data.api import LoginManager
     L = LoginManager(password=WDPASS, site=SITE)
     success = L.login()
     assert success
 
+    if use_entity_store:
+        entity_store.open_default_store()
+    if use_search_cache:
+        open_default_cache(ttl=search_cache_ttl)
+
     Q = ItemIds(SITE)
     P = PropertyIds(SITE)
 
@@ -215,128 +317,270 @@ def initialize(is_test=True):
     print('-------------------------')
 
 
+def resolve_unconfirmed_writes(site, journal:ImportJournal):
+    """Settle the journaled edits whose result was never recorded, before they are prepared again.
+
+    An edit of an existing item is safe to repeat: the item is fetched again and is left
+    unchanged if the edit was saved. A new item may already exist, so the user is shown
+    the items now carrying its label and enters the one created, or nothing if none was.
+    """
+    for key in journal.unconfirmed():
+        id = journal.match(key) if journal.has_match(key) else None
+        if id is not None:
+            print(f'{key} 的寫入結果未記錄，將重新比對 {id}')
+            journal.record_write(key, None, 'unconfirmed edit, prepared again')
+            continue
+
+        labels = [label['value'] for label in journal.payloads[key].get('labels', {}).values()]
+        print('-----------------------------')
+        print(f'{key} 的新項目可能已建立，但寫入結果未記錄')
+        for label in labels:
+            forget_searches(site, label)
+            for result in site.search_entities(label, 'zh-tw', 50, type='item'):
+                if result['label'] == label:
+                    print(f'    {result["id"]}: {label} ({result.get("concepturi", "")})')
+        created_id = input('輸入已建立的 Item ID，空白表示未建立：').strip().upper()
+        if created_id == '':
+            journal.record_write(key, None, 'not created, prepared again')
+        else:
+            journal.record_write(key, created_id)
+
+
 def prepare_candidate_items_data(site,
                                  election_data:ElectionData,
                                  district_type,
                                  election_item:ItemPage,
-                                 head=-1) -> ModificationList:
-
-    items_data:ModificationList = []
+                                 head=-1,
+                                 workers=1,
+                                 batch_size=50,
+                                 name_index:NameIndex=None,
+                                 match_tables:List[MatchTable]=None,
+                                 journal:ImportJournal=None) -> ModificationList:
+    """Prepare the item data of every candidate.
+
+    Pass a list as `match_tables` to collect the scored candidate/hit pairs; the whole
+    election can then be matched again, e.g. with another threshold, without fetching:
+    `MatchTable.concat(match_tables).best_matches(min_confidence)`.
+
+    With a `journal`, candidates already written are skipped, journaled match decisions
+    are reused instead of searching again, and new decisions are journaled.
+    """
+    return list(iter_candidate_items_data(site, election_data, district_type, election_item, head, workers,
+                                          batch_size, name_index, match_tables, journal))
+
+
+def iter_candidate_items_data(site,
+                              election_data:ElectionData,
+                              district_type,
+                              election_item:ItemPage,
+                              head=-1,
+                              workers=1,
+                              batch_size=50,
+                              name_index:NameIndex=None,
+                              match_tables:List[MatchTable]=None,
+                              journal:ImportJournal=None) -> Iterator[ItemModification]:
+    """prepare_candidate_items_data, yielding each ItemModification as soon as its batch is ready."""
 
     # For test run
     candidates = election_data.candidates.values()
     if head != -1:
-        candidates = itertools.islice(candidates, head)
-
-    for cand in candidates:
-        print('-----------------------------')
-        print(cand)
-
-        item = None
-
-        search_results = list(site.search_entities(cand.legal_name, 'zh-tw', 50, type='item'))
-        if len(search_results) > 0:
-            result_confidences = []
-            result_items = []
-            for result in search_results:
-                id = result['id']
-                label = result['label']
-                if label != cand.legal_name:
-                    continue
-                found_item = ItemPage(SITE, id)
-                confidence = same_person_confidence(found_item, cand)
-                if confidence >= 1:
-                    result_confidences.append(confidence)
-                    result_items.append(found_item)
-                    print(f'({confidence}) {result}')
-
-            if len(result_confidences) > 0:
-                max_confidence = max(result_confidences)
-                print(f'max_confidence: {max_confidence}')
-                best_matched_items = [result_items[i] for i, c in enumerate(result_confidences) if c == max_confidence]
-
-                if len(best_matched_items) > 1:
-                    raise ValueError('multiple results with same confidence')
-
-                best_matched_item = best_matched_items[0]
-                print(f'best matched item: {get_zhtw_label(best_matched_item)} ({best_matched_item.concept_uri()})')
-
-                item = best_matched_item
-
-        if item is None:
-            print('item not yet exist')
-            item = ItemPage(SITE)
-            data = {
-                'labels': LanguageDict({'zh-tw': cand.legal_name}),
-                'claims': ClaimCollection(site),
-            }
+        candidates = list(itertools.islice(candidates, head))
+
+    if journal is not None:
+        candidates = list(candidates)
+        remaining = [cand for cand in candidates if not journal.is_written(candidate_key(cand))]
+        if len(remaining) < len(candidates):
+            print(f'略過 {len(candidates) - len(remaining)} 位已寫入的候選人')
+        unconfirmed = set(journal.unconfirmed())
+        candidates = [cand for cand in remaining if candidate_key(cand) not in unconfirmed]
+        if len(candidates) < len(remaining):
+            print(f'略過 {len(remaining) - len(candidates)} 位寫入結果未確認的候選人')
+
+    if district_type == '區域立委':
+        districts = election_data.candidates.districts if head == -1 else [cand.district for cand in candidates]
+        prefetch_legislative_districts(site, districts, workers)
+
+    # Candidates are prepared by up to `workers` threads, `batch_size` at a time; results
+    # and logs are collected in input order so the output matches a sequential run.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batched(candidates, batch_size):
+            for log, item_data in prepare_candidates_batch(executor, site, batch, district_type, election_item,
+                                                           name_index, match_tables, journal):
+                for line in log:
+                    print(line)
+                yield item_data
+
+
+def prepare_candidates_batch(executor:ThreadPoolExecutor, site, candidates:List[Candidate], district_type,
+                             election_item:ItemPage, name_index:NameIndex=None, match_tables:List[MatchTable]=None,
+                             journal:ImportJournal=None):
+    """Match a batch of candidates, then build their item data.
+
+    Search hits come from the search API and are fetched in as few wbgetentities calls as
+    possible, or, with a name index, come from the index so only best matches are fetched.
+    Hits are reduced to EntityFeatures and every candidate/hit pair is scored at once.
+    Candidates with a match decision in the journal are not searched again.
+    """
+    logs = [['-----------------------------', str(cand)] for cand in candidates]
+    keys = [candidate_key(cand) for cand in candidates]
+    best_ids:List[Optional[str]] = [None] * len(candidates)
+
+    unmatched = []
+    for i, key in enumerate(keys):
+        if journal is not None and journal.has_match(key):
+            best_ids[i] = journal.match(key)
+            logs[i].append(f'journaled match: {best_ids[i]}')
         else:
-            data = item.get()
-
-        # Set data
-        # * [v] 性質 (P31) -> 人類 (Q5)
-        # * [v] 國籍 (P27) -> 中華民國 (Q865)
-        # * [v] 性別 (P21) -> 男或女        (+參考文獻)
-        # * [v] 出生日期 (P569)             (+參考文獻)
-        # * [v] 競選(P3602) -> 參與的選舉   (+參考文獻)
-        #     * [v] 選區 (P768) -> (Item)
-        #     * [v] 代表對象 (P1268) -> (Item) //推薦政黨
-        #     * [v] 得票數 (P1111) -> (Quantity)
-        #     * [v] 候選人號次 (P4243) -> (String)
-        # * [ ] 參考文獻結構
-        #     * [ ] 來源網址 (P854) : [政府資料開放平台](https://data.gov.tw/dataset/13119)
-        #     * [ ] 作品或名稱語言 (P407) : 中華民國國語 (Q262828)
-        #     * [ ] 檢索日期 (P813)
-
-        set_claim(data['claims'], site, P.INSTANCE_OF, ItemPage(site, Q.HUMAN))
-        set_claim(data['claims'], site, P.NATIONALITY, ItemPage(site, Q.TAIWAN))
-
-        if cand.gender == Gender.MALE:
-            gender = set_claim(data['claims'], site, P.GENDER, ItemPage(site, Q.MALE))
-        elif cand.gender == Gender.FEMALE:
-            gender = set_claim(data['claims'], site, P.GENDER, ItemPage(site, Q.FEMALE))
-
-        # Date of birth. If our data have higher precision and have no conflict, replace the existing value
-        if P.DATE_OF_BIRTH in data['claims']:
-            date_of_birth:Claim = data['claims'][P.DATE_OF_BIRTH][0]
-            if time_match(date_of_birth.getTarget(), cand.birth_date):
-                if date_of_birth.getTarget().precision < cand.birth_date.precision:
-                    date_of_birth.setTarget(cand.birth_date)
-            else:
-                date_of_birth = set_claim(data['claims'], site, P.DATE_OF_BIRTH, cand.birth_date)
+            unmatched.append(i)
+    unmatched_candidates = [candidates[i] for i in unmatched]
+
+    found_items = dict()
+    if name_index is None:
+        search_results = list(executor.map(lambda cand: search_candidate(site, cand), unmatched_candidates))
+        hit_ids = [result['id'] for results in search_results for result in results]
+        found_items = fetch_entities(site, hit_ids, executor=executor)
+        hit_features = {id: page_features(item, P, Q) for id, item in found_items.items()}
+    else:
+        hits = name_index.lookup_many(cand.legal_name for cand in unmatched_candidates)
+        search_results = [[{'id': f.id, 'label': f.label} for f in hits[cand.legal_name]]
+                          for cand in unmatched_candidates]
+        hit_features = {f.id: f for features in hits.values() for f in features}
+
+    matches = MatchTable.from_pairs(unmatched_candidates, [(i, hit_features[result['id']])
+                                                           for i, results in enumerate(search_results)
+                                                           for result in results if result['id'] in hit_features])
+    if match_tables is not None:
+        match_tables.append(matches)
+
+    for i, results, confidences in zip(unmatched, search_results, matches.candidate_confidences()):
+        best_ids[i] = find_candidate_item(candidates[i], results, confidences, logs[i])
+        if journal is not None:
+            journal.record_match(keys[i], best_ids[i])
+
+    # With a name index or a journaled match, only the best matches still need fetching
+    missing_ids = [id for id in best_ids if id is not None and id not in found_items]
+    if missing_ids:
+        found_items.update(fetch_entities(site, missing_ids, executor=executor))
+
+    def prepare(cand, best_id, log):
+        item = None if best_id is None else found_items.get(best_id)
+        if item is not None:
+            log.append(f'best matched item: {get_zhtw_label(item)} ({item.concept_uri()})')
+        item_data = prepare_candidate_item_data(site, cand, item, district_type, election_item, log)
+        return log, item_data
+
+    return executor.map(prepare, candidates, best_ids, logs)
+
+
+def search_candidate(site, cand:Candidate) -> List[dict]:
+    search_results = search_entities(site, cand.legal_name, 'zh-tw', 50, type='item')
+    return [result for result in search_results if result['label'] == cand.legal_name]
+
+
+def find_candidate_item(cand:Candidate, search_results:List[dict], confidences:Dict[str, float],
+                        log:List[str]) -> Optional[str]:
+
+    result_confidences = []
+    result_ids = []
+    for result in search_results:
+        confidence = confidences.get(result['id'])
+        if confidence is not None and confidence >= 1:
+            result_confidences.append(confidence)
+            result_ids.append(result['id'])
+            log.append(f'({confidence}) {result}')
+
+    if len(result_confidences) == 0:
+        return None
+
+    max_confidence = max(result_confidences)
+    log.append(f'max_confidence: {max_confidence}')
+    best_matched_ids = [result_ids[i] for i, c in enumerate(result_confidences) if c == max_confidence]
+
+    if len(best_matched_ids) > 1:
+        raise ValueError('multiple results with same confidence')
+
+    return best_matched_ids[0]
+
+
+def prepare_candidate_item_data(site, cand:Candidate, item:ItemPage, district_type, election_item:ItemPage,
+                                log:List[str]):
+
+    if item is None:
+        log.append('item not yet exist')
+        item = ItemPage(SITE)
+        data = {
+            'labels': LanguageDict({'zh-tw': cand.legal_name}),
+            'claims': ClaimCollection(site),
+        }
+    else:
+        data = item.get()
+    original = None if item.getID() == '-1' else {key: data[key].toJSON() for key in data}
+
+    # Set data
+    # * [v] 性質 (P31) -> 人類 (Q5)
+    # * [v] 國籍 (P27) -> 中華民國 (Q865)
+    # * [v] 性別 (P21) -> 男或女        (+參考文獻)
+    # * [v] 出生日期 (P569)             (+參考文獻)
+    # * [v] 競選(P3602) -> 參與的選舉   (+參考文獻)
+    #     * [v] 選區 (P768) -> (Item)
+    #     * [v] 代表對象 (P1268) -> (Item) //推薦政黨
+    #     * [v] 得票數 (P1111) -> (Quantity)
+    #     * [v] 候選人號次 (P4243) -> (String)
+    # * [ ] 參考文獻結構
+    #     * [ ] 來源網址 (P854) : [政府資料開放平台](https://data.gov.tw/dataset/13119)
+    #     * [ ] 作品或名稱語言 (P407) : 中華民國國語 (Q262828)
+    #     * [ ] 檢索日期 (P813)
+
+    set_claim(data['claims'], site, P.INSTANCE_OF, interned_item(site, Q.HUMAN))
+    set_claim(data['claims'], site, P.NATIONALITY, interned_item(site, Q.TAIWAN))
+
+    if cand.gender == Gender.MALE:
+        gender = set_claim(data['claims'], site, P.GENDER, interned_item(site, Q.MALE))
+    elif cand.gender == Gender.FEMALE:
+        gender = set_claim(data['claims'], site, P.GENDER, interned_item(site, Q.FEMALE))
+
+    # Date of birth. If our data have higher precision and have no conflict, replace the existing value
+    if P.DATE_OF_BIRTH in data['claims']:
+        date_of_birth:Claim = data['claims'][P.DATE_OF_BIRTH][0]
+        if dates_match(*encode_wbtime(date_of_birth.getTarget()), cand.birth_date_value, cand.birth_date_precision):
+            if date_of_birth.getTarget().precision < cand.birth_date_precision:
+                date_of_birth.setTarget(cand.birth_date)
         else:
             date_of_birth = set_claim(data['claims'], site, P.DATE_OF_BIRTH, cand.birth_date)
+    else:
+        date_of_birth = set_claim(data['claims'], site, P.DATE_OF_BIRTH, cand.birth_date)
 
-        # Candidacy
-        if election_item is None:
-            election_item = get_election_item(site, str(cand.district.code))
-        candidacy = set_claim(data['claims'], site, P.CANDIDACY, election_item)
+    # Candidacy
+    if election_item is None:
+        election_item = get_election_item(site, str(cand.district.code))
+    candidacy = set_claim(data['claims'], site, P.CANDIDACY, election_item)
 
-        district_item = get_district_item(site, cand.district, district_type)
-        if district_item is not None:
-            set_claim(candidacy.qualifiers, site, P.ELECTORAL_DISTRICT, district_item, is_qualifier=True)
+    district_item = get_district_item(site, cand.district, district_type)
+    if district_item is not None:
+        set_claim(candidacy.qualifiers, site, P.ELECTORAL_DISTRICT, district_item, is_qualifier=True)
 
-        if P.REPRESENTS in candidacy.qualifiers and candidacy.qualifiers[P.REPRESENTS][0].getSnakType() == 'novalue':
-            pass  # If there is 'novalue' claim, then ignore it.
-        else:
-            set_claim(candidacy.qualifiers, site, P.REPRESENTS, get_party_item(site, cand.party_id), is_qualifier=True)
-        set_claim(candidacy.qualifiers, site, P.VOTES_RECEIVED, WbQuantity(cand.votes), is_qualifier=True)
-        set_claim(candidacy.qualifiers, site, P.CANDIDATE_NUMBER, cand.number, is_qualifier=True)
+    if P.REPRESENTS in candidacy.qualifiers and candidacy.qualifiers[P.REPRESENTS][0].getSnakType() == 'novalue':
+        pass  # If there is 'novalue' claim, then ignore it.
+    else:
+        set_claim(candidacy.qualifiers, site, P.REPRESENTS, get_party_item(site, cand.party_id), is_qualifier=True)
+    set_claim(candidacy.qualifiers, site, P.VOTES_RECEIVED, WbQuantity(cand.votes), is_qualifier=True)
+    set_claim(candidacy.qualifiers, site, P.CANDIDATE_NUMBER, cand.number, is_qualifier=True)
 
-        references = [
-            make_claim(site, P.REFERENCE_URL, REFERENCE_URL, is_reference=True),
-            make_claim(site, P.LANGUAGE_OF_WORK, ItemPage(site, Q.NATIONAL_LANGUAGE_OF_ROC), is_reference=True),
-            make_claim(site, P.RETRIEVED, DATA_RETRIEVED_TIME, is_reference=True),
-        ]
+    claims_to_add_references = [gender, date_of_birth, candidacy]
+    for claim in claims_to_add_references:
+        if len(claim.sources) == 0:
+            add_sources(claim, make_references(site))  # sent with the item's editEntity
 
-        claims_to_add_references = [gender, date_of_birth, candidacy]
-        for claim in claims_to_add_references:
-            if len(claim.sources) == 0:
-                claim.addSources(copy.deepcopy(references))
+    changed = original is None or len(entity_json(data, original)) > 0
+    return ItemModification(item, data, original, candidate_key(cand), changed)
 
-        items_data.append((item, data))
 
-    return items_data
+def make_references(site) -> List[Claim]:
+    return [
+        make_claim(site, P.REFERENCE_URL, REFERENCE_URL, is_reference=True),
+        make_claim(site, P.LANGUAGE_OF_WORK, interned_item(site, Q.NATIONAL_LANGUAGE_OF_ROC), is_reference=True),
+        make_claim(site, P.RETRIEVED, data_retrieved_time(), is_reference=True),
+    ]
 
 
 def get_district_item(site:DataSite, district:District, district_type:str):
@@ -348,28 +592,65 @@ def get_district_item(site:DataSite, district:District, district_type:str):
         hrcis_code = district.code.HRCIS_str
         if len(hrcis_code) == 2:
             hrcis_code += '000'
-        data = [wdi_core.WDString(hrcis_code, MAIN_P.HRCIS_CODE)]
-        item = wdi_core.WDItemEngine(data=data, core_props={MAIN_P.HRCIS_CODE})
-        return AdaptiveEntity(site, item.wd_item_id)
+        index = default_district_index()
+        if hrcis_code in index:
+            return interned_adaptive_entity(site, index.get(hrcis_code))
+        # Not in the index (e.g. added to Wikidata after the last refresh)
+        from wikidataintegrator import wdi_core
+        main_p = main_property_ids()
+        data = [wdi_core.WDString(hrcis_code, main_p.HRCIS_CODE)]
+        item = wdi_core.WDItemEngine(data=data, core_props={main_p.HRCIS_CODE})
+        if item.wd_item_id:
+            index.add(hrcis_code, item.wd_item_id)
+        return interned_adaptive_entity(site, item.wd_item_id)
 
     elif district_type == '區域立委':
-        search_results = list(WD_SITE.search_entities(district.name, 'zh-tw', 5, type='item'))
-        if len(search_results) == 0:
-            return None
-        result = search_results[0]
-        id = result['id']
-        return AdaptiveEntity(site, id)
+        key = (site.sitename, district.name)
+        if key not in legislative_district_items:
+            legislative_district_items[key] = resolve_legislative_district(site, district.name)
+        return legislative_district_items[key]
 
     elif district_type == '山地立委':
-        return ItemPage(site, Q.HIGHLAND_ABORIGINE_DISTRICT)
+        return interned_item(site, Q.HIGHLAND_ABORIGINE_DISTRICT)
 
     elif district_type == '平地立委':
-        return ItemPage(site, Q.LOWLAND_ABORIGINE_DISTRICT)
+        return interned_item(site, Q.LOWLAND_ABORIGINE_DISTRICT)
 
     elif district_type == '其他':
         return None
 
 
+legislative_district_ids = dict()      # key: district name, value: item id (main site), None if not found
+legislative_district_items = dict()    # key: (sitename, district name), value: item, None if not found
+def resolve_legislative_district(site, name:str) -> Optional[ItemPage]:
+    if name not in legislative_district_ids:
+        search_results = search_entities(main_site(), name, 'zh-tw', 5, type='item')
+        legislative_district_ids[name] = search_results[0]['id'] if len(search_results) > 0 else None
+    id = legislative_district_ids[name]
+    return None if id is None else interned_adaptive_entity(site, id)
+
+def prefetch_legislative_districts(site, districts:Iterable[District], workers=1):
+    """Resolve every distinct district once, up to `workers` at a time, for get_district_item."""
+    names = list(dict.fromkeys(d.name for d in districts
+                               if d is not None and (site.sitename, d.name) not in legislative_district_items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        items = executor.map(lambda name: resolve_legislative_district(site, name), names)
+        for name, item in zip(names, items):
+            legislative_district_items[(site.sitename, name)] = item
+
+def load_legislative_district_mapping(filename):
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            legislative_district_ids[row[0]] = row[1]
+
+def save_legislative_district_mapping(filename):
+    with open(filename, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        for name, id in legislative_district_ids.items():
+            if id is not None:
+                writer.writerow([name, id])
+
+
 election_item_id_of_district = dict()   # key: district code str, value: item id
 def load_election_item_id_mapping(filename):
     with open(filename, 'r') as file:
@@ -378,130 +659,243 @@ def load_election_item_id_mapping(filename):
 
 def get_election_item(site, district_code: str):
     id = election_item_id_of_district.get(district_code)
-    return AdaptiveEntity(site, id)
+    return interned_adaptive_entity(site, id)
 
 
 entity_id_of_party = dict()     # key: party id, value: entity id
 def load_party_mapping(filename):
     with open(filename, 'r') as file:
         for row in csv.reader(file):
+            if row == ['PartyID', 'EntityID']:
+                continue    # header
             entity_id_of_party[row[0]] = row[1]
 
+
+def load_parties(site, filename):
+    """Load the party mapping and adapt every party entity in bulk."""
+    load_party_mapping(filename)
+    intern_adaptive_entities(site, entity_id_of_party.values())
+
 def get_party_item(site, party_id):
     if party_id == NO_PARTY:
-        return ItemPage(site, Q.INDEPENDENT_POLITICIAN)
+        return interned_item(site, Q.INDEPENDENT_POLITICIAN)
     else:
         party_entity_id = entity_id_of_party[party_id]
-        return AdaptiveEntity(site, party_entity_id)
+        return interned_adaptive_entity(site, party_entity_id)
 
 
-def same_person_confidence(item, cand:Candidate) -> int:
-    confidence = 1
+def same_person_confidence(item, cand:Candidate) -> float:
+    return features_confidence(page_features(item, P, Q), cand)
 
-    item_label = get_zhtw_label(item)
-    if item_label != cand.legal_name:
-        return 0
 
-    if P.CBDB_ID in item.claims:
-        return 0
+def write_candidates_data(items_data:Iterable[ItemModification], sleep_time=1, journal:ImportJournal=None):
+    """Write every changed item, at most `sleep_time` seconds apart unless the server asks to slow down.
 
-    if P.INSTANCE_OF in item.claims:
-        if find_claim(item.claims, P.INSTANCE_OF, Q.HUMAN) is None:
-            return 0
+    Unchanged items are skipped without a request or a wait.
+    """
 
-    if P.DATE_OF_BIRTH in item.claims:
-        item_birth_date = item.claims[P.DATE_OF_BIRTH][0].getTarget()
-        precision = min(item_birth_date.precision, cand.birth_date.precision)
+    def changed_items():
+        for modification in items_data:
+            if modification.changed:
+                yield modification
+            else:
+                skip_unchanged(modification, journal)
 
-        if precision >= WbTimePrecision.YEAR and item_birth_date.year != cand.birth_date.year:
-            return 0
-        if precision >= WbTimePrecision.MONTH and item_birth_date.month != cand.birth_date.month:
-            return 0
-        if precision >= WbTimePrecision.DAY and item_birth_date.day != cand.birth_date.day:
-            return 0
+    scheduler = WriteScheduler(max_interval=sleep_time)
+    print('========================================')
+    for _ in scheduler.run(changed_items(), lambda modification: write_modification(modification, journal),
+                           retry_unknown=can_repeat):
+        print('--------------------------------------')
 
-        confidence += (precision - WbTimePrecision.YEAR + 1)
 
-    if P.GENDER in item.claims:
-        values = [f'{claim.getTarget().getID()}' for claim in item.claims[P.GENDER]]
+def skip_unchanged(modification:ItemModification, journal:ImportJournal=None):
+    item = modification.item
+    print(f'未變更，略過： {item.getID()} ({item.concept_uri()})')
+    if journal is not None and modification.key is not None:
+        journal.record_unchanged(modification.key, item.getID())
 
-        item_is_male = Q.MALE in values
-        item_is_female = Q.FEMALE in values
 
-        if cand.gender == Gender.MALE:
-            if item_is_male:
-                confidence += 0.5
-            if item_is_female:
-                confidence -= 0.5
-        if cand.gender == Gender.FEMALE:
-            if item_is_female:
-                confidence += 0.5
-            if item_is_male:
-                confidence -= 0.5
+def entity_json(data:Dict, original:Optional[Dict]=None) -> Dict:
+    """JSON of `data` for editEntity; given the original JSON of the entity, only what changed.
 
-    if P.NATIONALITY in item.claims:
-        values = [f'{claim.getTarget().getID()}' for claim in item.claims[P.NATIONALITY]]
-        if Q.TAIWAN in values:
-            confidence += 0.5
-        else:
-            confidence -= 1
+    Changed claims are sent whole (with their qualifiers and references), unchanged ones are left out.
+    """
+    if original is None:
+        return {key: data[key].toJSON() for key in data}
+    diff = dict()
+    for key in data:
+        key_diff = data[key].toJSON(diffto=original.get(key))
+        if key_diff:
+            diff[key] = key_diff
+    return diff
 
-    if P.OCCUPATION in item.claims:
-        for claim in item.claims[P.OCCUPATION]:
-            occupation = claim.getTarget()
-            if occupation == Q.POLITICIAN:
-                confidence += 0.5
-                break
 
-    if P.PARTY_MEMBERSHIP in item.claims:
-        confidence += 0.1
+def can_repeat(modification:ItemModification) -> bool:
+    """Whether the edit may be sent again after an error that does not tell if it was saved.
 
-    return confidence
+    Sent twice, a new item or a statement without an ID would be created twice; other
+    statements and the labels are just set to the same value again.
+    """
+    if modification.item.getID() == '-1':
+        return False
+    claims = entity_json(modification.data, modification.original).get('claims', {})
+    return all('id' in claim for prop_claims in claims.values() for claim in prop_claims)
 
 
-def write_candidates_data(items_data:ModificationList, sleep_time=1):
+def write_modification(modification:ItemModification, journal:ImportJournal=None) -> Optional[Exception]:
+    item, data = modification
+    if journal is None or modification.key is None:
+        return write_candidate_data(item, data, modification.original)
 
-    print('========================================')
-    for (item, data) in items_data:
+    def record_result(item, err):
+        if err is not None and outcome_unknown(err):
+            return  # left unconfirmed, for resolve_unconfirmed_writes to settle on resume
+        journal.record_write(modification.key, item.getID() if err is None else None, err)
 
-        _data = dict()
-        for key in data:
-            _data[key] = data[key].toJSON()
-        data = _data
+    return write_candidate_data(item, data, modification.original,
+                                on_payload=lambda payload: journal.record_payload(modification.key, payload),
+                                on_result=record_result)
 
-        is_new_str = '(new)' if item.getID() == '-1' else ''
 
-        @dataclass
-        class EditEntityResult():
-            item: ItemPage
-            err: Exception
+def write_candidate_data(item:ItemPage, data:Dict, original:Optional[Dict]=None,
+                         on_payload=None, on_result=None) -> Optional[Exception]:
+    """Write `data` to the item; with the original JSON of the item, only the changes are sent.
 
-        result = EditEntityResult
+    `on_payload(payload)` is called before the edit and `on_result(item, err)` after it.
+    """
 
-        def collect_edit_results(item, err):
-            result.item = item
-            result.err = err
+    full_size = len(json.dumps(entity_json(data))) if original is not None else None
+    data = entity_json(data, original)
+    size = len(json.dumps(data))
+    if on_payload is not None:
+        on_payload(data)
 
-        item.editEntity(data, callback=collect_edit_results)
+    is_new_str = '(new)' if item.getID() == '-1' else ''
 
-        if result.err is None:
-            print(f'已寫入： {is_new_str} {(item.getID())} ({item.concept_uri()})')
+    @dataclass
+    class EditEntityResult():
+        item: ItemPage
+        err: Exception
+
+    result = EditEntityResult
+
+    def collect_edit_results(item, err):
+        result.item = item
+        result.err = err
+
+    item.editEntity(data, callback=collect_edit_results)
+    if on_result is not None:
+        on_result(item, result.err)
+    if is_new_str:
+        # Cached searches made before the item existed would not find it, even if the edit seemed to fail
+        for label in data.get('labels', {}).values():
+            forget_searches(item.site, label['value'])
+
+    if result.err is None:
+        print(f'已寫入： {is_new_str} {(item.getID())} ({item.concept_uri()})')
+        if full_size is None:
+            print(f'    {size} bytes')
         else:
-            print('匯入失敗')
-            print(result.err)
+            print(f'    {size} bytes (完整資料 {full_size} bytes，節省 {full_size - size} bytes)')
+    else:
+        print('匯入失敗')
+        print(result.err)
 
-        time.sleep(sleep_time)
+    return result.err
 
-        print('--------------------------------------')
+
+def stream_candidates_data(items_data:Iterable[ItemModification], sleep_time=1, queue_size=20,
+                           journal:ImportJournal=None):
+    """Write items while they are still being prepared.
+
+    A thread drains `items_data` (e.g. iter_candidate_items_data) into a queue of at
+    most `queue_size` items, so reads and writes overlap and only queued items are
+    held in memory. Returns the numbers of new, modified, unchanged and failed items.
+    """
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+    producer_error = []
+
+    def put(item) -> bool:
+        # Never block for good: the consumer may have stopped reading
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item_data in items_data:
+                if not put(item_data):
+                    break
+            if stop.is_set() and hasattr(items_data, 'close'):
+                items_data.close()    # let the generator shut its workers down here
+        except BaseException as err:
+            producer_error.append(err)
+        finally:
+            put(done)
+
+    producer = threading.Thread(target=produce, name='prepare', daemon=True)
+    producer.start()
+
+    counts = {'new': 0, 'modified': 0, 'unchanged': 0}
+
+    def queued_items():
+        while True:
+            modification = items.get()
+            if modification is done:
+                return
+            if modification.changed:
+                yield modification
+            else:
+                skip_unchanged(modification, journal)
+                counts['unchanged'] += 1
+
+    def write(modification):
+        is_new = modification.item.getID() == '-1'
+        err = write_modification(modification, journal)
+        if err is None:
+            counts['new' if is_new else 'modified'] += 1
+        return err
+
+    scheduler = WriteScheduler(max_interval=sleep_time)
+    failed_count = 0
+    print('========================================')
+    try:
+        for _, err in scheduler.run(queued_items(), write, retry_unknown=can_repeat):
+            if err is not None:
+                failed_count += 1
+            print('--------------------------------------')
+    finally:
+        # Stop and wait for the producer before returning, so that it no longer prepares
+        # items nor writes to the journal once the caller closes it
+        stop.set()
+        while True:
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                break
+        producer.join()
+
+    if producer_error:
+        raise producer_error[0]
+    return counts['new'], counts['modified'], counts['unchanged'], failed_count
 
 
 def print_modifications(items_data:ModificationList):
 
     print('========================================')
-    for (item, data) in items_data:
+    for modification in items_data:
+        item, data = modification
         label = get_zhtw_label(data['labels'])
         if item.getID() == '-1':
             print(f'(new)  {label}')
+        elif not modification.changed:
+            print(f'(same) {label} ({item.concept_uri()})')
         else:
             print(f'(edit) {label} ({item.concept_uri()})')
 
@@ -534,15 +928,15 @@ def print_modifications(items_data:ModificationList):
     print('========================================')
 
 
-def election_id_create_interface(dir_name, district_type):
+def election_id_create_interface(dir_name, district_type, chunksize=None, cache=True):
 
-    election_data = ElectionData(dir_name, district_type)
+    election_data = ElectionData(dir_name, district_type, chunksize=chunksize, cache=cache)
     election_data.candidates
 
     districts = dict()
     for cand in election_data.candidates.values():
         district = cand.district
-        if str(district.code) not in districts:
+        if district.code not in districts:
             districts[district.code] = district
     districts = districts.values()
 
@@ -553,7 +947,7 @@ def election_id_create_interface(dir_name, district_type):
 
     default_election_item_id = input('輸入預設值 (optional)：')
     if default_election_item_id != '':
-        default_election_item = ItemPage(WD_SITE, default_election_item_id)
+        default_election_item = ItemPage(main_site(), default_election_item_id)
         print(f'{get_zhtw_label(default_election_item)} ({default_election_item.concept_uri()})')
         id_mapping['*'] = default_election_item_id
 
@@ -563,7 +957,7 @@ def election_id_create_interface(dir_name, district_type):
     for district in districts:
         election_item_id = input(f'{district}: ')
         if election_item_id != '':
-            election_item = ItemPage(WD_SITE, election_item_id)
+            election_item = ItemPage(main_site(), election_item_id)
             print(f'{get_zhtw_label(election_item)} ({election_item.concept_uri()})')
             id_mapping[str(district.code)] = election_item_id
 
@@ -1,46 +1,53 @@
 import atexit
-import os
-
-import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
 
 from pywikibot import (
-    Site,
-    DataSite,
     ItemPage,
     PropertyPage,
 )
+from pywikibot.exceptions import Error
 from pywikibot.page import WikibasePage
+from pywikibot.site import DataSite
 
 from .get_label import get_label_fallback, FALLBACK_CHAIN_ZHTW_EN
-from .wd_utils import create_item, create_property
-
+from .wd_utils import create_item, create_property, fetch_entities
+from .mapping_store import JournaledMapping
+from .sites import TEST_SITENAME, main_site, test_site
+from .write_scheduler import WriteScheduler, outcome_unknown
 
-MAIN_SITE = Site('wikidata', 'wikidata')
-TEST_SITE = Site('test', 'wikidata')
 
 class AdaptiveEntity(ItemPage, PropertyPage):
 
     cache_filename = 'entity_ids_cache.csv'
-    test_entity_ids = dict()
+    test_entity_ids:JournaledMapping = None     # main-site ID -> test-site ID, loaded on first use
+    lock = threading.RLock()    # adapting the same entity from two threads would create it twice
+    create_scheduler = WriteScheduler(max_interval=10)  # pywikibot's put throttle is off (user-config.py)
 
     def __init__(self, site:DataSite, entity_id, ns=None, search_limit=5, languages=FALLBACK_CHAIN_ZHTW_EN):
         pass
 
     def __new__(cls, site:DataSite, entity_id, ns=None, search_limit=5, languages=FALLBACK_CHAIN_ZHTW_EN):
         if entity_id[0] == 'Q':
-            entity = ItemPage(MAIN_SITE, entity_id, ns)
+            entity = ItemPage(main_site(), entity_id, ns)
         elif entity_id[0] == 'P':
-            entity = PropertyPage(MAIN_SITE, entity_id)
+            entity = PropertyPage(main_site(), entity_id)
         else:
             raise ValueError('non supported entity type')
 
-        if site.sitename == TEST_SITE.sitename:
+        if site.sitename == TEST_SITENAME:
             return cls.adapt(entity)
         else:
             return entity
 
     @classmethod
     def adapt(cls, wd_entity:WikibasePage, search_limit=5, languages=FALLBACK_CHAIN_ZHTW_EN):
+        with cls.lock:
+            return cls._adapt(wd_entity, search_limit, languages)
+
+    @classmethod
+    def _adapt(cls, wd_entity:WikibasePage, search_limit=5, languages=FALLBACK_CHAIN_ZHTW_EN):
 
         assert wd_entity.site.sitename == 'wikidata:wikidata'
 
@@ -48,66 +55,157 @@ class AdaptiveEntity(ItemPage, PropertyPage):
         test_id = cls.cache_get(wd_entity.getID())
         if test_id is not None:
             if test_id[0] == 'Q':
-                return ItemPage(TEST_SITE, test_id)
+                return ItemPage(test_site(), test_id)
             elif test_id[0] == 'P':
-                return PropertyPage(TEST_SITE, test_id)
+                return PropertyPage(test_site(), test_id)
 
         # search corresponding item
         wd_label = get_label_fallback(wd_entity, languages)
-
-        search_results = TEST_SITE.search_entities(wd_label,
-                                                   languages[0],
-                                                   total=search_limit,
-                                                   type=wd_entity.entity_type)
-
-        for result in search_results:
-            result_id = result['id']
-            result_label = result['label']
-            if result_label == wd_label:
-                if wd_entity.entity_type == 'item':
-                    found_entity = ItemPage(TEST_SITE, result_id)
-                elif wd_entity.entity_type == 'property':
-                    found_entity = PropertyPage(TEST_SITE, result_id)
-                    if found_entity.type != wd_entity.type:
-                        continue
-                cls.cache_set(wd_entity.getID(), found_entity.getID())
-                print(f'Adapted: {wd_label} ({wd_entity.getID()}) -> ({found_entity.getID()})')
-
-                return found_entity
+        found_entity = cls._search_test_entity(wd_entity, search_limit, languages)
+        if found_entity is not None:
+            cls.cache_set(wd_entity.getID(), found_entity.getID())
+            print(f'Adapted: {wd_label} ({wd_entity.getID()}) -> ({found_entity.getID()})')
+            return found_entity
 
         # create when not found
 
-        labels = {languages[0]: wd_label}
-        if wd_entity.entity_type == 'item':
-            new_entity = create_item(TEST_SITE, labels)
-        elif wd_entity.entity_type == 'property':
-            new_entity = create_property(TEST_SITE, labels, wd_entity.entity_type)
+        new_entity = cls._create_test_entity(wd_entity, {languages[0]: wd_label})
 
         cls.cache_set(wd_entity.getID(), new_entity.getID())
         print(f'Created: {wd_label} ({new_entity.getID()})')
 
         return new_entity
 
+    @classmethod
+    def adapt_many(cls, site:DataSite, entity_ids:Iterable[str], search_limit=5, languages=FALLBACK_CHAIN_ZHTW_EN,
+                   workers=8) -> Dict[str, WikibasePage]:
+        """AdaptiveEntity(site, id) for many main-site IDs at once, keyed by those IDs.
+
+        Labels of the entities not adapted yet are fetched in batched wbgetentities calls,
+        the test site is searched for them concurrently and the entities found are
+        committed in one journal write; the missing ones are created, each recorded
+        as soon as it exists.
+        """
+        entity_ids = list(dict.fromkeys(entity_ids))
+        for entity_id in entity_ids:
+            if entity_id[0] not in ('Q', 'P'):
+                raise ValueError('non supported entity type')
+
+        if site.sitename != TEST_SITENAME:
+            return {id: ItemPage(main_site(), id) if id[0] == 'Q' else PropertyPage(main_site(), id)
+                    for id in entity_ids}
+
+        with cls.lock:
+            cls.mapping().refresh()
+            missing = [id for id in entity_ids if cls.mapping().get(id) is None]
+
+            wd_entities = fetch_entities(main_site(), missing)
+            missing = [id for id in missing if id in wd_entities]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                found = list(executor.map(lambda id: cls._search_test_entity(wd_entities[id], search_limit, languages),
+                                          missing))
+
+            cls.mapping().set_many({id: entity.getID() for id, entity in zip(missing, found) if entity is not None})
+            for id, found_entity in zip(missing, found):
+                wd_entity = wd_entities[id]
+                wd_label = get_label_fallback(wd_entity, languages)
+                if found_entity is not None:
+                    print(f'Adapted: {wd_label} ({id}) -> ({found_entity.getID()})')
+                    continue
+                new_entity = cls._create_test_entity(wd_entity, {languages[0]: wd_label})
+                # Recorded at once, so that a failure later on cannot lose an entity that already exists
+                cls.mapping().set(id, new_entity.getID())
+                print(f'Created: {wd_label} ({new_entity.getID()})')
+
+        # IDs wbgetentities did not return go the one-by-one way
+        return {id: cls._test_page(cls.mapping().get(id)) if id in cls.mapping() else cls(site, id)
+                for id in entity_ids}
+
+    @classmethod
+    def _create_test_entity(cls, wd_entity:WikibasePage, labels) -> WikibasePage:
+        """Create the entity on the test site, paced and retried by create_scheduler."""
+        created = []
+
+        def create():
+            try:
+                if wd_entity.entity_type == 'item':
+                    created.append(create_item(test_site(), labels))
+                else:
+                    created.append(create_property(test_site(), labels, wd_entity.type))
+            except Error as err:
+                return err
+
+        # A creation is never repeated after a server error: the entity may exist already
+        err = cls.create_scheduler.run_one(create)
+        if err is not None:
+            if outcome_unknown(err):
+                print(f'{wd_entity.getID()} {labels} 可能已在測試站建立，下次執行會先以標籤搜尋')
+            raise err
+        return created[0]
+
+    @staticmethod
+    def _test_page(test_id:str) -> WikibasePage:
+        if test_id[0] == 'Q':
+            return ItemPage(test_site(), test_id)
+        return PropertyPage(test_site(), test_id)
+
+    @staticmethod
+    def _search_test_entity(wd_entity:WikibasePage, search_limit, languages) -> Optional[WikibasePage]:
+        wd_label = get_label_fallback(wd_entity, languages)
+        search_results = test_site().search_entities(wd_label,
+                                                   languages[0],
+                                                   total=search_limit,
+                                                   type=wd_entity.entity_type)
+        for result in search_results:
+            if result['label'] != wd_label:
+                continue
+            if wd_entity.entity_type == 'item':
+                return ItemPage(test_site(), result['id'])
+            found_entity = PropertyPage(test_site(), result['id'])
+            if found_entity.type == wd_entity.type:
+                return found_entity
+        return None
+
+    @classmethod
+    def mapping(cls) -> JournaledMapping:
+        with cls.lock:
+            if cls.test_entity_ids is None:
+                cls.cache_load()
+            return cls.test_entity_ids
+
     @classmethod
     def cache_set(cls, main_id:str, test_id:str):
-        cls.test_entity_ids[main_id] = test_id
-        cls.cache_save()
+        cls.mapping().set(main_id, test_id)
 
     @classmethod
     def cache_get(cls, main_id:str):
-        return cls.test_entity_ids.get(main_id)
+        test_id = cls.mapping().get(main_id)
+        if test_id is None:
+            # another run sharing the file may have adapted it meanwhile
+            cls.mapping().refresh()
+            test_id = cls.mapping().get(main_id)
+        return test_id
 
     @classmethod
     def cache_save(cls):
-        df = pd.DataFrame(cls.test_entity_ids.items())
-        df.to_csv(cls.cache_filename, index=False, header=False)
+        cls.mapping().sync()
 
     @classmethod
     def cache_load(cls):
-        assert os.path.isfile(cls.cache_filename)
-        df = pd.read_csv(cls.cache_filename, header=None)
-        cls.test_entity_ids = dict(zip(list(df[0]), list(df[1])))
+        cls.test_entity_ids = JournaledMapping(cls.cache_filename)
+
+    @classmethod
+    def cache_close(cls):
+        if cls.test_entity_ids is not None:
+            cls.test_entity_ids.close()
+
+
+def __getattr__(name):
+    if name == 'MAIN_SITE':
+        return main_site()
+    if name == 'TEST_SITE':
+        return test_site()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
-AdaptiveEntity.cache_load()
-atexit.register(AdaptiveEntity.cache_save)
+atexit.register(AdaptiveEntity.cache_close)
@@ -1,15 +1,25 @@
+import numpy as np
 import pandas as pd
 
 
-def stripLeadingApostrophe(df: pd.DataFrame):
-    df.replace('^\'*', '', regex=True, inplace=True)
+def clean_column(df: pd.DataFrame, col):
+    """Strip leading apostrophes and surrounding whitespace, rewriting only the cells that have them."""
+    column = df[col]
+    values = column.to_numpy(dtype=object, copy=True)
+    # Every cell is stripped into a new array; cells that come out equal are not written
+    # back, and the column in df is only replaced when at least one cell changed.
+    cleaned = np.array([value.lstrip('\'').strip() if type(value) is str else value for value in values],
+                       dtype=object)
+    dirty = (cleaned != values) & pd.notna(values)
+    if dirty.any():
+        values[dirty] = cleaned[dirty]
+        df[col] = pd.Series(values, index=column.index, dtype=column.dtype)
 
 
 def clean_df(df: pd.DataFrame):
-    stripLeadingApostrophe(df)
     for col in df.columns:
-        if type(col[0]) == str:
-            df[col] = df[col].str.strip()
+        if pd.api.types.is_string_dtype(df[col].dtype):
+            clean_column(df, col)
 
 
 def test():
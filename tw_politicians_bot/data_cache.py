@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_VERSION = 3
+
+Fingerprint = Tuple[int, int, str]     # (size, mtime_ns, sha256)
+
+
+def file_hash(path:Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path:Path) -> Fingerprint:
+    stat = path.stat()
+    return (stat.st_size, stat.st_mtime_ns, file_hash(path))
+
+
+def fingerprint_matches(path:Path, cached:Fingerprint) -> Tuple[bool, Fingerprint]:
+    """Check a source file against its cached fingerprint, hashing only when size matches but mtime does not."""
+    stat = path.stat()
+    size, mtime_ns, digest = cached
+    if stat.st_size != size:
+        return False, cached
+    if stat.st_mtime_ns == mtime_ns:
+        return True, cached
+    fingerprint = (stat.st_size, stat.st_mtime_ns, file_hash(path))
+    return fingerprint[2] == digest, fingerprint
+
+
+def load_tables(cache_path:Path, sources:List[Path]) -> Optional[Dict[str, pd.DataFrame]]:
+    """Tables stored in cache_path, or None if it is missing, unreadable or older than the sources."""
+    try:
+        # Plain arrays only: loading the cache must never run code from it
+        with np.load(cache_path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        meta = json.loads(str(arrays.pop('meta')))
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        print(f'無法讀取快取 {cache_path}: {err}')
+        return None
+
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    fingerprints = {name: tuple(fingerprint) for name, fingerprint in meta['fingerprints'].items()}
+    if sorted(fingerprints) != sorted(source.name for source in sources):
+        return None
+
+    touched = False
+    for source in sources:
+        try:
+            matches, fingerprint = fingerprint_matches(source, fingerprints[source.name])
+        except OSError:
+            return None
+        if not matches:
+            return None
+        if fingerprint != fingerprints[source.name]:
+            fingerprints[source.name] = fingerprint
+            touched = True
+
+    try:
+        tables = {table: _frame_from_arrays(table, columns, arrays) for table, columns in meta['tables'].items()}
+    except (KeyError, ValueError) as err:
+        print(f'無法讀取快取 {cache_path}: {err}')
+        return None
+
+    if touched:
+        # Same content, new mtime: remember it so the next run can skip hashing
+        meta['fingerprints'] = fingerprints
+        _write(cache_path, meta, arrays)
+    return tables
+
+
+def save_tables(cache_path:Path, sources:List[Path], tables:Dict[str, pd.DataFrame]):
+    meta = {
+        'version': CACHE_VERSION,
+        'fingerprints': {source.name: file_fingerprint(source) for source in sources},
+        'tables': dict(),
+    }
+    arrays = dict()
+    for table, df in tables.items():
+        meta['tables'][table] = _frame_to_arrays(table, df, arrays)
+    _write(cache_path, meta, arrays)
+
+
+def _frame_to_arrays(table:str, df:pd.DataFrame, arrays:Dict[str, np.ndarray]) -> List[Tuple[str, Optional[str]]]:
+    """Store each column of df in arrays; string columns as fixed-width unicode plus a mask of missing values.
+
+    Gives the (name, string dtype) of each column, the dtype being None for numeric columns.
+    """
+    columns = []
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            arrays[f'{table}.{i}'] = series.to_numpy()
+            columns.append((column, None))
+        else:
+            null = series.isna().to_numpy()
+            arrays[f'{table}.{i}'] = series.where(~null, '').to_numpy(dtype=str)
+            arrays[f'{table}.{i}.null'] = null
+            columns.append((column, str(series.dtype)))
+    return columns
+
+
+def _frame_from_arrays(table:str, columns:List[Tuple[str, Optional[str]]], arrays:Dict[str, np.ndarray]) -> pd.DataFrame:
+    data = dict()
+    for i, (column, str_dtype) in enumerate(columns):
+        values = arrays[f'{table}.{i}']
+        if str_dtype is not None:
+            values = values.astype(object)
+            values[arrays[f'{table}.{i}.null']] = np.nan
+            values = pd.Series(values).astype(str_dtype)
+        data[column] = values
+    return pd.DataFrame(data)
+
+
+def _write(cache_path:Path, meta:dict, arrays:Dict[str, np.ndarray]):
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    try:
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        print(f'無法寫入快取 {cache_path}: {err}')
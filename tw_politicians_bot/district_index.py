@@ -0,0 +1,111 @@
+import csv
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from pywikibot.data.sparql import SparqlQuery
+
+
+DISTRICT_INDEX_FILENAME = 'hrcis_district_index.csv'
+
+HRCIS_QUERY = 'SELECT ?item ?code WHERE { ?item wdt:P5020 ?code . }'
+
+
+def entity_id(value:str) -> str:
+    """Q-ID of an entity URI (http://www.wikidata.org/entity/Q123) or of a bare ID."""
+    return value.rsplit('/', 1)[-1]
+
+
+class DistrictIndex():
+    """HRCIS code (P5020) -> district item IDs of Wikidata (main site), kept in a CSV file."""
+
+    def __init__(self, items_of_code:Dict[str, List[str]]=None):
+        self.items_of_code = items_of_code if items_of_code is not None else dict()
+
+    def __len__(self):
+        return len(self.items_of_code)
+
+    def __contains__(self, code):
+        return code in self.items_of_code
+
+    def add(self, code:str, id:str):
+        ids = self.items_of_code.setdefault(code, [])
+        if id not in ids:
+            ids.append(id)
+
+    def get(self, code:str) -> Optional[str]:
+        """The item with this code; None if there is none, ValueError if there are several."""
+        ids = self.items_of_code.get(code)
+        if not ids:
+            return None
+        if len(ids) > 1:
+            raise ValueError(f'multiple items with HRCIS code {code}: {ids}')
+        return ids[0]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rows of (item, code); items may be entity URIs as exported by the query service."""
+        index = cls()
+        for item, code in rows:
+            index.add(code, entity_id(item))
+        return index
+
+    @classmethod
+    def load(cls, filename=DISTRICT_INDEX_FILENAME):
+        with open(filename, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return cls()
+            item_col, code_col = header.index('item'), header.index('code')
+            return cls.from_rows((row[item_col], row[code_col]) for row in reader)
+
+    def save(self, filename=DISTRICT_INDEX_FILENAME):
+        with open(filename, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['code', 'item'])
+            for code in sorted(self.items_of_code):
+                for id in self.items_of_code[code]:
+                    writer.writerow([code, id])
+
+    @classmethod
+    def query(cls, repo=None):
+        """Every P5020 statement of Wikidata, in one SPARQL query."""
+        results = SparqlQuery(repo=repo).select(HRCIS_QUERY)
+        if results is None:
+            raise RuntimeError('HRCIS code query failed')
+        return cls.from_rows((result['item'], result['code']) for result in results)
+
+
+def refresh_district_index(filename=DISTRICT_INDEX_FILENAME, source=None, repo=None) -> DistrictIndex:
+    """Rebuild the index file from the query service, or from an exported CSV with `item` and `code` columns."""
+    index = DistrictIndex.query(repo) if source is None else DistrictIndex.load(source)
+    index.save(filename)
+    print(f'已寫入 {len(index)} 個行政區代碼至 {filename}')
+    return index
+
+
+_default_index:Optional[DistrictIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def default_district_index(filename=DISTRICT_INDEX_FILENAME, repo=None) -> DistrictIndex:
+    """The index in `filename`, created with one query on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            try:
+                _default_index = DistrictIndex.load(filename)
+            except FileNotFoundError:
+                print(f'找不到 {filename}，從 Wikidata 下載')
+                _default_index = refresh_district_index(filename, repo=repo)
+        return _default_index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        print('usage: python -m tw_politicians_bot.district_index [exported.csv|-] [hrcis_district_index.csv]')
+        print('       (without a file or with -, the codes are queried from the Wikidata Query Service)')
+        sys.exit(1)
+    source = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+    refresh_district_index(*sys.argv[2:], source=source)
@@ -1,12 +1,17 @@
+import sys
 from pathlib import Path
 from dataclasses import dataclass
 from enum import Enum
-from typing import Tuple,Dict
+from typing import Tuple,Dict,Iterator
+from collections.abc import Mapping, Sequence
 
+import numpy as np
 import pandas as pd
 from pywikibot import WbTime
 
 from .clean_df import clean_df
+from .wb_time_utils import WbTimePrecision, encode_date, decode_wbtime
+from . import data_cache
 
 
 def parse_birth_date(birth_str:str) -> WbTime:
@@ -22,18 +27,82 @@ def parse_birth_date(birth_str:str) -> WbTime:
     return wb_time
 
 
+def parse_birth_dates(birth_str:pd.Series) -> pd.DataFrame:
+    """Vectorized parse_birth_date, giving integer-encoded dates and their precisions."""
+    has_day = (birth_str.str.len() == 7).to_numpy()
+    year = birth_str.str[0:3].astype(int).to_numpy() + 1911
+    month = np.where(has_day, pd.to_numeric(birth_str.str[3:5], errors='coerce').fillna(0).to_numpy(), 0)
+    day = np.where(has_day, pd.to_numeric(birth_str.str[5:7], errors='coerce').fillna(0).to_numpy(), 0)
+    return pd.DataFrame({
+        'birth_date': encode_date(year, month.astype(int), day.astype(int)).astype(np.int32),
+        'birth_precision': np.where(has_day, WbTimePrecision.DAY, WbTimePrecision.YEAR).astype(np.int8),
+    }, index=birth_str.index)
+
+
 class DistrictCode:
+    """Immutable 省市/縣市/選區/鄉鎮市區/村里 code.
+
+    The full code and the HRCIS code are built once, as interned strings, so
+    ``str(code)`` and hashing cost no allocation and equal codes share storage.
+    """
+
+    __slots__ = ('codes', '_code', '_hrcis', '_hrcis_str')
+
+    WIDTHS = (2, 3, 2, 3, 4)
+
+    def __init__(self, codes):
+        codes = self.normalize(tuple(codes))
+        setter = super().__setattr__
+        setter('codes', tuple(sys.intern(c) for c in codes))
+        setter('_code', sys.intern(''.join(codes)))
+        hrcis = self._make_hrcis(codes)
+        setter('_hrcis', hrcis)
+        setter('_hrcis_str', None if hrcis is None else sys.intern(''.join(hrcis)))
+
+    @classmethod
+    def from_str(cls, code_str:str):
+        codes = []
+        start = 0
+        for width in cls.WIDTHS:
+            codes.append(code_str[start:start+width])
+            start += width
+        return cls(codes)
 
-    def __init__(self, codes:list):
-        self.codes = codes
-        self.normalize()
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __reduce__(self):
+        # The default protocol sets the slots one by one, which __setattr__ refuses
+        return (self.__class__, (self.codes,))
 
     def __str__(self):
-        return ''.join(self.codes)
+        return self._code
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._code!r})'
+
+    def __eq__(self, other):
+        if isinstance(other, DistrictCode):
+            return self._code == other._code
+        return NotImplemented
 
-    def normalize(self):
-        if self.codes == ['00', '000', '01', '000', '0000']:
-            self.codes[2] = '00'
+    def __hash__(self):
+        return hash(self._code)
+
+    @staticmethod
+    def normalize(codes:tuple) -> tuple:
+        if codes == ('00', '000', '01', '000', '0000'):
+            return ('00', '000', '00', '000', '0000')
+        return codes
+
+    @staticmethod
+    def _make_hrcis(codes:tuple):
+        if not codes[4][0].isnumeric():
+            return None
+        hrcis = list(codes[0:2] + codes[3:5])
+        while len(hrcis) > 0 and all(c == '0' for c in hrcis[-1]):
+            hrcis.pop()
+        return tuple(hrcis)
 
     def province(self):
         return self.codes[0]
@@ -52,19 +121,11 @@ class DistrictCode:
 
     @property
     def HRCIS(self):
-        if not self.village()[0].isnumeric():
-            return None
-        hrcis = self.codes[0:2] + self.codes[3:5]
-        while len(hrcis) > 0 and all(c == '0' for c in hrcis[-1]):
-            hrcis.pop()
-        return hrcis
+        return self._hrcis
 
     @property
     def HRCIS_str(self):
-        hrcis = self.HRCIS
-        if hrcis is None:
-            return None
-        return ''.join(hrcis)
+        return self._hrcis_str
 
 
 @dataclass
@@ -88,10 +149,15 @@ class Candidate:
     legal_name: str
     party_id: str
     gender: Gender
-    birth_date: WbTime
+    birth_date_value: int       # see wb_time_utils.encode_date
+    birth_date_precision: int
     birth_place: str
     votes: int = -1
 
+    @property
+    def birth_date(self) -> WbTime:
+        return decode_wbtime(self.birth_date_value, self.birth_date_precision)
+
     def __str__(self):
         return (f'Candidate:(\n' +
                 f'    District: {self.district}\n' +
@@ -102,26 +168,275 @@ class Candidate:
                 f')')
 
 
+class CandidateView:
+    """One row of a CandidateTable, with the attributes of a Candidate."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table:'CandidateTable', index:int):
+        self.table = table
+        self.index = index
+
+    @property
+    def district(self) -> District:
+        return self.table.districts[self.table.district_index[self.index]]
+
+    @property
+    def number(self) -> str:
+        return self.table.number[self.index]
+
+    @property
+    def legal_name(self) -> str:
+        return self.table.legal_name[self.index]
+
+    @property
+    def party_id(self) -> str:
+        return self.table.party_id[self.index]
+
+    @property
+    def gender(self) -> Gender:
+        return Gender(int(self.table.gender[self.index]))
+
+    @property
+    def birth_date_value(self) -> int:
+        return int(self.table.birth_date[self.index])
+
+    @property
+    def birth_date_precision(self) -> int:
+        return int(self.table.birth_precision[self.index])
+
+    @property
+    def birth_date(self) -> WbTime:
+        return decode_wbtime(self.birth_date_value, self.birth_date_precision)
+
+    @property
+    def birth_place(self) -> str:
+        return self.table.birth_place[self.index]
+
+    @property
+    def votes(self) -> int:
+        return int(self.table.votes[self.index])
+
+    @votes.setter
+    def votes(self, value:int):
+        self.table.votes[self.index] = value
+
+    @property
+    def key(self) -> Tuple[str,str]:
+        return (str(self.table.district_codes[self.index]), self.number)
+
+    __str__ = Candidate.__str__
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key})'
+
+
+class CandidateRows(Sequence):
+
+    def __init__(self, table:'CandidateTable'):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CandidateView(self.table, i) for i in range(len(self.table))[index]]
+        if index < 0:
+            index += len(self.table)
+        if not 0 <= index < len(self.table):
+            raise IndexError(index)
+        return CandidateView(self.table, index)
+
+
+class CandidateTable(Mapping):
+    """Candidates stored column-wise, keyed by (district code, number) like ElectionData.candidates used to be.
+
+    Party IDs, numbers and birth places are categoricals, districts are indexes into
+    one District per distinct district, and rows are handed out as CandidateView.
+    """
+
+    def __init__(self, df:pd.DataFrame):
+        district_codes = pd.Categorical(df['FullDistrictCode'])
+        self.district_index = district_codes.codes.astype(np.int32)
+        self.district_codes = district_codes
+
+        _, first_positions = np.unique(self.district_index, return_index=True)
+        first_rows = df.iloc[first_positions]
+        self.districts = [
+            District(DistrictCode(codes), name) if not pd.isna(name) else None
+            for *codes, name in zip(*(first_rows[col] for col in DISTRICT_CODE_COLUMNS), first_rows['名稱'])
+        ]
+
+        self.number = pd.Categorical(df['號次'])
+        self.legal_name = df['名字'].to_numpy(dtype=object)
+        self.party_id = pd.Categorical(df['政黨編號'])
+        self.gender = df['性別'].to_numpy(dtype=np.int8)
+        self.birth_date = df['birth_date'].to_numpy(dtype=np.int32)
+        self.birth_precision = df['birth_precision'].to_numpy(dtype=np.int8)
+        self.birth_place = pd.Categorical(df['出生地'])
+        self.votes = df['得票數'].to_numpy(dtype=np.int64, copy=True)
+
+        self._row_of_key:Dict[Tuple[str,str],int] = None
+
+    def __len__(self):
+        return len(self.legal_name)
+
+    def __iter__(self) -> Iterator[Tuple[str,str]]:
+        return zip(map(str, self.district_codes), self.number)
+
+    def __getitem__(self, key:Tuple[str,str]) -> CandidateView:
+        if self._row_of_key is None:
+            self._row_of_key = {k: i for i, k in enumerate(self)}
+        return CandidateView(self, self._row_of_key[key])
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def values(self) -> CandidateRows:
+        return CandidateRows(self)
+
+    def items(self):
+        return zip(self, self.values())
+
+    def nbytes(self) -> int:
+        arrays = [self.district_index, self.gender, self.birth_date, self.birth_precision, self.votes]
+        categoricals = [self.district_codes, self.number, self.party_id, self.birth_place]
+        return (sum(a.nbytes for a in arrays)
+                + sum(c.memory_usage(deep=True) for c in categoricals)
+                + pd.Series(self.legal_name).memory_usage(deep=True, index=False))
+
+
 def read_csv_clean(filename, **kwargs):
     df = pd.read_csv(filename, **kwargs)
     clean_df(df)
     return df
 
 
+def read_csv_clean_chunks(filename, chunksize, **kwargs):
+    with pd.read_csv(filename, chunksize=chunksize, **kwargs) as reader:
+        for df in reader:
+            clean_df(df)
+            yield df
+
+
+DISTRICT_CODE_COLUMNS = ['省市', '縣市', '選區', '鄉鎮市區', '村里']
+
+
+def full_district_codes(df:pd.DataFrame, normalize=True) -> pd.Series:
+    """Vectorized ``str(DistrictCode(list(row[0:5])))`` over a whole frame."""
+    codes = df[DISTRICT_CODE_COLUMNS[0]].str.cat(df[DISTRICT_CODE_COLUMNS[1:]])
+    if normalize:
+        codes = codes.mask(codes == '00000010000000', '00000000000000')
+    return codes
+
+
+class VoteAccumulator():
+    """Vote counts of a fixed set of candidates, filled in from elctks rows chunk by chunk.
+
+    Only rows of the candidates' own districts are kept; as with a row-by-row load,
+    the last row seen for a candidate wins.
+    """
+
+    def __init__(self, keys:pd.MultiIndex):
+        self.keys = keys
+        self.district_codes = keys.levels[0]
+        self.votes = np.full(len(keys), -1, dtype=np.int64)
+        self.matched_rows = 0
+
+    def add(self, df:pd.DataFrame):
+        full_district_code = full_district_codes(df, normalize=False)
+        mask = full_district_code.isin(self.district_codes).to_numpy()
+        if not mask.any():
+            return
+        self.matched_rows += int(mask.sum())
+
+        rows = pd.MultiIndex.from_arrays([full_district_code[mask], df['號次'][mask]])
+        positions = self.keys.get_indexer(rows)
+        votes = df['得票數'][mask].to_numpy()
+
+        found = (positions >= 0) & ~pd.Index(positions).duplicated(keep='last')
+        self.votes[positions[found]] = votes[found].astype(np.int64)
+
+
 class ElectionData():
 
-    def __init__(self, dir_name, district_type, elbase='elbase.csv', elcand='elcand.csv', elctks='elctks.csv'):
+    def __init__(self, dir_name, district_type, elbase='elbase.csv', elcand='elcand.csv', elctks='elctks.csv',
+                 chunksize=None, cache=True, keep_frames=False):
         self.dir = Path(dir_name)
         self.district_type = district_type
         self.elbase = elbase
         self.elcand = elcand
         self.elctks = elctks
+        self.chunksize = chunksize  # if set, elctks is streamed in chunks of this many rows
+
+        self.districts_df:pd.DataFrame = None
+        self.candidates_df:pd.DataFrame = None
+        self._districts:Dict[str,District] = None
+        self._candidates:CandidateTable = None
+
+        if not (cache and self.load_cache()):
+            self.load_districts()
+            self.load_candidates()
+            self.load_votes()
+            if cache:
+                self.save_cache()
+
+        if not keep_frames:
+            self.drop_frames()
 
-        self.candidates:Dict[Tuple[str,str],Candidate] = None
+    @property
+    def cache_path(self) -> Path:
+        return self.dir/f'election_data_cache_{self.district_type}.npz'
+
+    @property
+    def source_paths(self):
+        return [self.dir/self.elbase, self.dir/self.elcand, self.dir/self.elctks]
+
+    def load_cache(self) -> bool:
+        tables = data_cache.load_tables(self.cache_path, self.source_paths)
+        if tables is None:
+            return False
+        self.districts_df = tables['districts']
+        self.candidates_df = tables['candidates']
+        return True
+
+    def save_cache(self):
+        tables = {
+            'districts': self.districts_df,
+            'candidates': self.candidates_df,
+        }
+        data_cache.save_tables(self.cache_path, self.source_paths, tables)
+
+    def drop_frames(self):
+        """Build the candidate table and let go of the parsed frames, which take several times its memory.
+
+        Only the district codes and names are kept, for `districts`.
+        """
+        self._candidates = CandidateTable(self.candidates_df)
+        self.candidates_df = None
+        self.districts_df = self.districts_df[['FullDistrictCode', '名稱']].copy()
 
-        self.load_districts()
-        self.load_candidates()
-        self.load_votes()
+    @property
+    def districts(self) -> Dict[str,District]:
+        if self._districts is None:
+            df = self.districts_df
+            self._districts = {
+                code_str: District(DistrictCode.from_str(code_str), name)
+                for code_str, name in zip(df['FullDistrictCode'], df['名稱'])
+            }
+        return self._districts
+
+    @property
+    def candidates(self) -> CandidateTable:
+        # With keep_frames, the table is only built on first access
+        if self._candidates is None:
+            self._candidates = CandidateTable(self.candidates_df)
+        return self._candidates
 
     def load_districts(self):
         header = ['省市', '縣市', '選區', '鄉鎮市區', '村里', '名稱']
@@ -130,11 +445,9 @@ class ElectionData():
         if self.district_type == '行政區':
             df['選區'] = '00'
 
-        self.districts = dict()
-        for row in df.iloc:
-            code = DistrictCode(list(row[0:5]))
-            name = row[5]
-            self.districts[str(code)] = District(code, name)
+        df.insert(0, 'FullDistrictCode', full_district_codes(df))
+        self.districts_df = df.drop_duplicates('FullDistrictCode', keep='last').reset_index(drop=True)
+        self._districts = None
 
     def load_candidates(self):
         header = ['省市', '縣市', '選區', '鄉鎮市區', '村里', '號次',
@@ -146,39 +459,44 @@ class ElectionData():
         if self.district_type == '行政區':
             df['選區'] = '00'
 
-        self.candidates = dict()
-        for row in df.iloc:
-            code_str = str(DistrictCode(list(row[0:5])))
-            district = self.districts.get(code_str)
-            number = row['號次']
-            legal_name = row['名字']
-            party_id = row['政黨編號']
-            gender = Gender(row['性別'])
-            birth_date = parse_birth_date(row['出生日期'])
-            birth_place = row['出生地']
-            candidate = Candidate(district, number, legal_name, party_id, gender, birth_date, birth_place)
-            self.candidates[(code_str, number)] = candidate
+        df.insert(0, 'FullDistrictCode', full_district_codes(df))
+        df = df.drop_duplicates(['FullDistrictCode', '號次'], keep='last')
+        df = df.join(parse_birth_dates(df['出生日期']))
+
+        district_names = self.districts_df[['FullDistrictCode', '名稱']]
+        df = df.merge(district_names, on='FullDistrictCode', how='left')
+        df['得票數'] = -1
+
+        self.candidates_df = df
+        self._candidates = None
 
     def load_votes(self):
         header = ['省市', '縣市', '選區', '鄉鎮市區', '村里', '投開票所', '號次', '得票數', '得票率', '當選註記']
-        df = read_csv_clean(self.dir/self.elctks, names=header, dtype=str)
-        df = df.astype({'得票數': int}, copy=False)
-
-        if self.district_type == '行政區' and (df['選區'] == '01').all():
-            df['選區'] = '00'
+        if self.chunksize is None:
+            chunks = [read_csv_clean(self.dir/self.elctks, names=header, dtype=str)]
+        else:
+            chunks = read_csv_clean_chunks(self.dir/self.elctks, self.chunksize, names=header, dtype=str)
 
-        full_district_code = df[header[0]].str.cat(df[header[1:5]])
-        df.insert(0, 'FullDistrictCode', full_district_code)
-        main_district_codes = [key[0] for key in self.candidates.keys()]
-        df = df[df['FullDistrictCode'].isin(main_district_codes)]
+        keys = pd.MultiIndex.from_frame(self.candidates_df[['FullDistrictCode', '號次']])
+        accumulator = VoteAccumulator(keys)
 
-        if df.shape[0] == 0:
+        # For 行政區, 選區 '01' is read as '00' only if the whole file uses '01', which is
+        # not known before the last chunk, so votes are collected for both readings.
+        if self.district_type == '行政區':
+            accumulator_00 = VoteAccumulator(keys)
+            all_01 = True
+        for df in chunks:
+            accumulator.add(df)
+            if self.district_type == '行政區' and all_01:
+                all_01 = bool((df['選區'] == '01').all())
+                if all_01:
+                    accumulator_00.add(df.assign(選區='00'))
+
+        if self.district_type == '行政區' and all_01:
+            accumulator = accumulator_00
+
+        if accumulator.matched_rows == 0:
             raise RuntimeError(f'Cannot load {self.elctks} correctly')
 
-        for row in df.iloc:
-            code = row['FullDistrictCode']
-            number = row['號次']
-            votes = row['得票數']
-
-            cand = self.candidates[(code, number)]
-            cand.votes = votes
+        self.candidates_df['得票數'] = accumulator.votes
+        self._candidates = None
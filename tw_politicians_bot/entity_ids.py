@@ -9,10 +9,10 @@ class EntityIds():
 
     def adapt(self):
         if self.site.sitename != 'wikidata:wikidata':
-            for field in self.get_constant_fields():
-                main_id = getattr(self, field)
-                test_id = AdaptiveEntity(self.site, main_id).getID()
-                setattr(self, field, test_id)
+            fields = self.get_constant_fields()
+            adapted = AdaptiveEntity.adapt_many(self.site, [getattr(self, field) for field in fields])
+            for field in fields:
+                setattr(self, field, adapted[getattr(self, field)].getID())
 
     def get_constant_fields(self):
         return [f for f in dir(self.__class__) if f.isupper()]
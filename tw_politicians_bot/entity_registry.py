@@ -0,0 +1,77 @@
+import re
+import threading
+from typing import Callable, Dict, Hashable, Iterable
+
+from pywikibot import ItemPage
+from pywikibot.page import WikibasePage
+
+from .adaptive_entity import AdaptiveEntity
+
+
+ENTITY_ID_REGEX = re.compile(r'[QP][1-9][0-9]*')
+
+
+class EntityRegistry():
+    """One page object per key, shared by every candidate of a run.
+
+    Pages used as claim targets (constants, parties, elections, districts) are created,
+    adapted and loaded once instead of once per candidate.
+    """
+
+    def __init__(self):
+        self.pages:Dict[Hashable, WikibasePage] = dict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key:Hashable, create:Callable[[], WikibasePage]) -> WikibasePage:
+        with self.lock:
+            page = self.pages.get(key)
+            if page is not None:
+                self.hits += 1
+                return page
+            self.misses += 1
+        # Created outside the lock, adapting may take a few requests; the first one stored wins
+        page = create()
+        with self.lock:
+            return self.pages.setdefault(key, page)
+
+    def add(self, key:Hashable, page:WikibasePage) -> WikibasePage:
+        with self.lock:
+            return self.pages.setdefault(key, page)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __str__(self):
+        return f'entity registry: {len(self)} entities, {self.hits} hits, {self.misses} misses'
+
+
+DEFAULT_REGISTRY = EntityRegistry()
+
+
+def interned_item(site, id:str) -> ItemPage:
+    """ItemPage(site, id), created once per (site, id)."""
+    return DEFAULT_REGISTRY.get((site.sitename, id), lambda: ItemPage(site, id))
+
+
+def interned_adaptive_entity(site, main_id:str) -> WikibasePage:
+    """AdaptiveEntity(site, main_id), adapted once per (site, main-site ID)."""
+    return DEFAULT_REGISTRY.get((site.sitename, 'adapted', main_id), lambda: AdaptiveEntity(site, main_id))
+
+
+def intern_adaptive_entities(site, main_ids:Iterable[str]):
+    """Adapt many entities in bulk (AdaptiveEntity.adapt_many) for later interned_adaptive_entity calls.
+
+    Values that are not entity IDs are left out, to fail only if interned_adaptive_entity is asked for them.
+    """
+    main_ids = [id for id in dict.fromkeys(main_ids)
+                if ENTITY_ID_REGEX.fullmatch(id) and (site.sitename, 'adapted', id) not in DEFAULT_REGISTRY.pages]
+    for main_id, page in AdaptiveEntity.adapt_many(site, main_ids).items():
+        DEFAULT_REGISTRY.add((site.sitename, 'adapted', main_id), page)
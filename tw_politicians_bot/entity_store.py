@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from pywikibot import ItemPage, PropertyPage
+from pywikibot.page import WikibasePage
+
+
+ENTITY_STORE_FILENAME = 'entity_store.sqlite'
+
+
+class EntityStore():
+    """Entity JSON kept across runs in a SQLite file, keyed by site and ID.
+
+    Cached entities are revalidated at most once per run, in bulk, by comparing their
+    stored `lastrevid` with the one reported by a revision-only wbgetentities query;
+    only entities that changed (or were never seen) are fetched in full.
+    """
+
+    def __init__(self, filename=ENTITY_STORE_FILENAME, groupsize=50):
+        self.filename = filename
+        self.groupsize = groupsize
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS entities ('
+                              'site TEXT NOT NULL, id TEXT NOT NULL, lastrevid INTEGER, json TEXT NOT NULL, '
+                              'PRIMARY KEY (site, id))')
+        self.validated = set()  # (sitename, id) checked against the server during this run
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_many(self, site, ids:List[str]) -> Dict[str, dict]:
+        entities = dict()
+        with self.lock:
+            for group in _groups(ids, 500):
+                placeholders = ','.join('?' * len(group))
+                rows = self.conn.execute(f'SELECT id, json FROM entities WHERE site = ? AND id IN ({placeholders})',
+                                         [site.sitename, *group])
+                for id, content in rows:
+                    entities[id] = json.loads(content)
+        return entities
+
+    def put_many(self, site, entities:Dict[str, dict]):
+        rows = [(site.sitename, id, content.get('lastrevid'), json.dumps(content, ensure_ascii=False))
+                for id, content in entities.items()]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)', rows)
+
+    def delete_many(self, site, ids:List[str]):
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM entities WHERE site = ? AND id = ?', [(site.sitename, id) for id in ids])
+
+    def load(self, site, ids:Iterable[str], executor=None) -> Dict[str, dict]:
+        """Current JSON of the given entities; missing entities are left out."""
+        ids = list(dict.fromkeys(ids))
+        cached = self.get_many(site, ids)
+
+        to_check = [id for id in cached if (site.sitename, id) not in self.validated]
+        current_revids = fetch_revision_ids(site, to_check, self.groupsize, executor)
+        gone = [id for id in to_check if id not in current_revids]
+        self.delete_many(site, gone)
+
+        stale = [id for id in ids
+                 if id not in cached or id in gone
+                 or (id in current_revids and current_revids[id] != cached[id].get('lastrevid'))]
+        fresh = {id: content for id, content in cached.items() if id not in stale and id not in gone}
+        self.hits += len(fresh)
+        self.misses += len(stale)
+
+        fetched = fetch_entities_json(site, stale, self.groupsize, executor)
+        self.put_many(site, fetched)
+
+        self.validated.update((site.sitename, id) for id in ids)
+        return {id: fresh.get(id, fetched.get(id)) for id in ids if id in fresh or id in fetched}
+
+
+def _groups(ids:List[str], size:int):
+    return [ids[i:i+size] for i in range(0, len(ids), size)]
+
+
+def _map(func, groups, executor):
+    if executor is None:
+        return map(func, groups)
+    return executor.map(func, groups)
+
+
+def fetch_revision_ids(site, ids:List[str], groupsize=50, executor=None) -> Dict[str, int]:
+    def fetch_group(group):
+        request = site.simple_request(action='wbgetentities', ids='|'.join(group), props='info')
+        return request.submit()['entities']
+
+    revids = dict()
+    for entities in _map(fetch_group, _groups(ids, groupsize), executor):
+        for id, content in entities.items():
+            if 'missing' not in content:
+                revids[id] = content.get('lastrevid')
+    return revids
+
+
+def fetch_entities_json(site, ids:List[str], groupsize=50, executor=None) -> Dict[str, dict]:
+    def fetch_group(group):
+        request = site.simple_request(action='wbgetentities', ids='|'.join(group))
+        return request.submit()['entities']
+
+    fetched = dict()
+    for entities in _map(fetch_group, _groups(ids, groupsize), executor):
+        for id, content in entities.items():
+            if 'missing' not in content:
+                fetched[id] = content
+    return fetched
+
+
+def entity_page(site, content:dict) -> WikibasePage:
+    """A page filled from wbgetentities JSON without another request."""
+    if content.get('type') == 'property':
+        page = PropertyPage(site, content['id'])
+    else:
+        page = ItemPage(site, content['id'])
+    page._content = content
+    page.get()
+    return page
+
+
+def fill_page(page:WikibasePage):
+    """Load a page's content through the default store, if there is one and the page is not loaded yet."""
+    store = DEFAULT_STORE
+    if store is None or hasattr(page, '_content') or page.getID() == '-1':
+        return
+    content = store.load(page.repo, [page.getID()]).get(page.getID())
+    if content is not None:
+        page._content = content
+        page.get()
+
+
+DEFAULT_STORE:Optional[EntityStore] = None
+
+
+def open_default_store(filename=ENTITY_STORE_FILENAME) -> EntityStore:
+    global DEFAULT_STORE
+    if DEFAULT_STORE is None or DEFAULT_STORE.filename != filename:
+        DEFAULT_STORE = EntityStore(filename)
+    return DEFAULT_STORE
@@ -1,24 +1,32 @@
-from typing import Union, MutableMapping
+import sys
+from typing import TYPE_CHECKING, Union, MutableMapping
 
-from wikidataintegrator.wdi_core import WDItemEngine
 from pywikibot.page import WikibasePage
 
+if TYPE_CHECKING:
+    from wikidataintegrator.wdi_core import WDItemEngine
+
+from .entity_store import fill_page
+
 
 FALLBACK_CHAIN_ZHTW_EN = ['zh-tw', 'zh-hant', 'zh', 'en']
 FALLBACK_CHAIN_ZHTW = ['zh-tw', 'zh-hant', 'zh']
 
 
-def get_zhtw_label(obj:Union[WDItemEngine, WikibasePage, MutableMapping], include_en=False):
+def get_zhtw_label(obj:Union['WDItemEngine', WikibasePage, MutableMapping], include_en=False):
     if include_en:
         return get_label_fallback(obj, FALLBACK_CHAIN_ZHTW_EN)
     else:
         return get_label_fallback(obj, FALLBACK_CHAIN_ZHTW)
 
 
-def get_label_fallback(obj:Union[WDItemEngine, WikibasePage, MutableMapping], fallback_chain):
-    if isinstance(obj, WDItemEngine):
+def get_label_fallback(obj:Union['WDItemEngine', WikibasePage, MutableMapping], fallback_chain):
+    # wikidataintegrator is heavy to import; an object can only be a WDItemEngine once it is loaded
+    wdi_core = sys.modules.get('wikidataintegrator.wdi_core')
+    if wdi_core is not None and isinstance(obj, wdi_core.WDItemEngine):
         return get_label_fallback_WDItemEngine(obj, fallback_chain)
     if isinstance(obj, WikibasePage):
+        fill_page(obj)
         return get_label_fallback_LanguageDict(obj.labels, fallback_chain)
     if isinstance(obj, MutableMapping):
         return get_label_fallback_LanguageDict(obj, fallback_chain)
@@ -26,7 +34,7 @@ def get_label_fallback(obj:Union[WDItemEngine, WikibasePage, MutableMapping], fa
     raise TypeError
 
 
-def get_label_fallback_WDItemEngine(item:WDItemEngine, fallback_chain):
+def get_label_fallback_WDItemEngine(item:'WDItemEngine', fallback_chain):
     for lang in fallback_chain:
         label = item.get_label(lang)
         if label != '':
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+
+JOURNAL_FILENAME = 'import_journal.jsonl'
+
+
+def candidate_key(cand) -> str:
+    """Identifies a candidate of an election across runs."""
+    code = '' if cand.district is None else cand.district.code    # district may be missing for 其他
+    return f'{code}/{cand.number}/{cand.legal_name}'
+
+
+class ImportJournal():
+    """Append-only JSON-lines record of an import, so that an interrupted run can be resumed.
+
+    The first line describes the run (site, source directory, district type); after it
+    come `match` (the item chosen for a candidate, null for a new one), `payload` (the
+    JSON sent to wbeditentity), `write` (the resulting ID or the error) and `unchanged`
+    (an item skipped as it already had all the data) records, the last one of each kind
+    per candidate counting. Write records are fsync'ed before the next edit starts; a
+    torn last line left by a crash is ignored.
+    """
+
+    def __init__(self, filename, run:Dict, resume=False):
+        self.filename = str(filename)
+        self.run = run
+        self.matches:Dict[str, Optional[str]] = dict()
+        self.payloads:Dict[str, Dict] = dict()
+        self.written:Dict[str, str] = dict()
+        self.lock = threading.Lock()
+
+        if resume and os.path.isfile(self.filename) and os.path.getsize(self.filename) > 0:
+            self._load()
+            self.file = open(self.filename, 'ab')
+            with open(self.filename, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    self.file.write(b'\n')     # end the torn line
+        else:
+            if os.path.isfile(self.filename) and os.path.getsize(self.filename) > 0:
+                os.replace(self.filename, self.filename + '.old')
+            self.file = open(self.filename, 'ab')
+            self._append(dict(run, type='run'), sync=True)
+
+    def _load(self):
+        with open(self.filename, 'rb') as file:
+            lines = file.read().split(b'\n')
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue    # torn or empty line
+        if not records or records[0].get('type') != 'run':
+            raise ValueError(f'{self.filename} is not an import journal')
+        run = {key: value for key, value in records[0].items() if key != 'type'}
+        if run != self.run:
+            raise ValueError(f'{self.filename} is the journal of another import: {run}')
+
+        for record in records[1:]:
+            key = record.get('key')
+            if record['type'] == 'match':
+                self.matches[key] = record['id']
+            elif record['type'] == 'payload':
+                self.payloads[key] = record['data']
+                self.written.pop(key, None)
+            elif record['type'] == 'write':
+                self.payloads.pop(key, None)
+                if record['error'] is None:
+                    self.written[key] = record['id']
+            elif record['type'] == 'unchanged':
+                self.written[key] = record['id']
+
+    def _append(self, record:Dict, sync=False):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def has_match(self, key:str) -> bool:
+        return key in self.matches
+
+    def match(self, key:str) -> Optional[str]:
+        """The journaled item ID for the candidate, None for a new item."""
+        return self.matches[key]
+
+    def record_match(self, key:str, id:Optional[str]):
+        self.matches[key] = id
+        self._append({'type': 'match', 'key': key, 'id': id})
+
+    def record_payload(self, key:str, data:Dict):
+        self.payloads[key] = data
+        self._append({'type': 'payload', 'key': key, 'data': data}, sync=True)
+
+    def record_write(self, key:str, id:Optional[str], err=None):
+        """The result of the edit: the item ID, or an error (an exception or a message)."""
+        self.payloads.pop(key, None)
+        if err is None:
+            self.written[key] = id
+        self._append({'type': 'write', 'key': key, 'id': id, 'error': None if err is None else str(err)},
+                     sync=True)
+
+    def record_unchanged(self, key:str, id:str):
+        self.written[key] = id
+        self._append({'type': 'unchanged', 'key': key, 'id': id})
+
+    def is_written(self, key:str) -> bool:
+        return key in self.written
+
+    def unconfirmed(self) -> List[str]:
+        """Candidates whose payload was sent without a recorded result; the edit may or may not have been saved."""
+        return list(self.payloads)
+
+    def close(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
@@ -0,0 +1,199 @@
+import csv
+import os
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def locked(path:str, exclusive=True):
+    """Hold an advisory lock on `path` (created if needed) while other processes wait for it."""
+    with open(path, 'a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        else:
+            # msvcrt has no shared locks; lock the first byte exclusively, retrying until it is free
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class JournaledMapping():
+    """A str -> str mapping kept in a CSV snapshot plus an append-only journal.
+
+    `set` appends one checksummed line to `<filename>.journal` (fsync'ed every
+    `sync_every` lines and on `sync`), so adding an entry costs O(1) I/O. Loading reads
+    the snapshot and replays the journal; torn or corrupt lines left by a crash are
+    ignored. When the journal has more than `compact_after` lines it is folded into the
+    snapshot, which is replaced atomically. A lock file serializes writers, so several
+    processes can share one mapping; `refresh` picks up what the others appended.
+    The snapshot is a plain `key,value` CSV, so an existing one is imported as is.
+    """
+
+    def __init__(self, filename, sync_every=20, compact_after=1000):
+        self.filename = str(filename)
+        self.journal_filename = self.filename + '.journal'
+        self.lock_filename = self.filename + '.lock'
+        self.sync_every = sync_every
+        self.compact_after = compact_after
+        self.mapping:Dict[str, str] = dict()
+        self.generation = None      # first line of the journal, changes on compaction
+        self.offset = 0             # journal bytes already replayed
+        self.journal_lines = 0
+        self.unsynced = 0
+        self.journal = None
+        self.reload()
+
+    def get(self, key:str) -> Optional[str]:
+        return self.mapping.get(key)
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def items(self):
+        return self.mapping.items()
+
+    def set(self, key:str, value:str):
+        self.set_many({key: value})
+
+    def set_many(self, entries:Dict[str, str]):
+        """Append several entries with one write."""
+        if len(entries) == 0:
+            return
+        with locked(self.lock_filename):
+            self._refresh()
+            if self.journal is None:
+                self.journal = open(self.journal_filename, 'ab')
+            lines = []
+            for key, value in entries.items():
+                record = f'{key},{value}'
+                lines.append(f'{record},{zlib.crc32(record.encode("utf-8")):08x}\n'.encode('utf-8'))
+            if os.path.getsize(self.journal_filename) > self.offset:
+                lines.insert(0, b'\n')     # end the torn line a crashed writer left behind
+            self.journal.write(b''.join(lines))
+            self.journal.flush()
+            self.unsynced += len(entries)
+            self._refresh()
+            if self.unsynced >= self.sync_every:
+                self._sync()
+
+    def sync(self):
+        if self.journal is not None:
+            with locked(self.lock_filename):
+                self._sync()
+
+    def refresh(self):
+        """Replay what other processes appended since the last read."""
+        with locked(self.lock_filename, exclusive=False):
+            self._refresh()
+
+    def reload(self):
+        with locked(self.lock_filename):
+            self._start_journal()
+            self._reload()
+            if self.journal_lines > self.compact_after:
+                self._compact()
+
+    def compact(self):
+        with locked(self.lock_filename):
+            self._refresh()
+            self._compact()
+
+    def close(self):
+        if self.journal is not None:
+            with locked(self.lock_filename):
+                self._sync()
+                if self.journal_lines > self.compact_after:
+                    self._refresh()
+                    self._compact()
+            self.journal.close()
+            self.journal = None
+
+    def _sync(self):
+        if self.journal is not None and self.unsynced > 0:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.unsynced = 0
+
+    def _start_journal(self):
+        if not os.path.isfile(self.journal_filename) or os.path.getsize(self.journal_filename) == 0:
+            self._new_journal()
+
+    def _new_journal(self):
+        # Truncated in place rather than replaced, so append handles of other processes stay valid
+        with open(self.journal_filename, 'wb') as file:
+            file.write(f'# {uuid.uuid4().hex}\n'.encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _reload(self):
+        self.mapping = dict()
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'r', encoding='utf-8', newline='') as file:
+                for row in csv.reader(file):
+                    if len(row) == 2:
+                        self.mapping[row[0]] = row[1]
+        self.generation = None
+        self.offset = 0
+        self.journal_lines = 0
+        self._refresh()
+
+    def _refresh(self):
+        with open(self.journal_filename, 'rb') as file:
+            generation = file.readline()
+            if generation != self.generation:
+                if self.generation is not None:
+                    # compacted by another process: its journal now starts from the new snapshot
+                    self._reload()
+                    return
+                self.generation = generation
+                self.offset = len(generation)
+            file.seek(self.offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break   # torn write, not committed
+                self.offset += len(line)
+                self.journal_lines += 1
+                record, _, crc = line.decode('utf-8', errors='replace').rstrip('\n').rpartition(',')
+                key, sep, value = record.partition(',')
+                if sep and crc == f'{zlib.crc32(record.encode("utf-8")):08x}':
+                    self.mapping[key] = value
+
+    def _compact(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file, lineterminator='\n')
+            for key, value in self.mapping.items():
+                writer.writerow([key, value])
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, self.filename)
+        self._new_journal()
+        self.generation = None
+        self.offset = 0
+        self.journal_lines = 0
+        self._refresh()
+        self.unsynced = 0
@@ -0,0 +1,215 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .election_data import Gender
+from .entity_ids import ItemIds, PropertyIds
+from .get_label import get_label_fallback_LanguageDict, FALLBACK_CHAIN_ZHTW
+from .wb_time_utils import WbTimePrecision, WB_TIME_REGEX, encode_date, dates_match
+
+
+GENDER_MALE = 1
+GENDER_FEMALE = 2
+
+NATIONALITY_NONE = -1      # no nationality claim
+NATIONALITY_OTHER = 0
+NATIONALITY_TAIWAN = 1
+
+
+class EntityFeatures(NamedTuple):
+    """What same_person_confidence looks at, extracted from an entity's JSON."""
+    id: str
+    label: Optional[str]
+    has_instance_of: bool
+    human: bool
+    birth_date: int         # wb_time_utils encoding, 0 if unknown
+    birth_precision: int    # 0 if unknown
+    gender: int             # GENDER_MALE | GENDER_FEMALE bits
+    nationality: int        # NATIONALITY_*
+    politician: bool
+    party: bool
+    cbdb: bool
+
+
+def _claim_values(content:dict, prop:str):
+    for claim in content.get('claims', {}).get(prop, []):
+        datavalue = claim.get('mainsnak', {}).get('datavalue')
+        if datavalue is not None:
+            yield datavalue['value']
+
+
+def _item_ids(content:dict, prop:str):
+    return {value['id'] if 'id' in value else f'Q{value["numeric-id"]}' for value in _claim_values(content, prop)}
+
+
+def _time(value:dict):
+    match = re.match(WB_TIME_REGEX, value['time'])
+    if match is None:
+        return 0, 0
+    year, month, day = (int(g) for g in match.group(1, 2, 3))
+    precision = value['precision']
+    month = month if precision >= WbTimePrecision.MONTH else 0
+    day = day if precision >= WbTimePrecision.DAY else 0
+    return encode_date(year, month, day), precision
+
+
+def entity_features(content:dict, P=PropertyIds, Q=ItemIds) -> EntityFeatures:
+    """Features of an entity in wbgetentities / JSON dump format; P and Q default to main-site IDs."""
+    labels = {lang: label['value'] for lang, label in content.get('labels', {}).items()}
+    claims = content.get('claims', {})
+
+    birth_date, birth_precision = 0, 0
+    for value in _claim_values(content, P.DATE_OF_BIRTH):
+        birth_date, birth_precision = _time(value)
+        break
+
+    genders = _item_ids(content, P.GENDER)
+    gender = (GENDER_MALE if Q.MALE in genders else 0) | (GENDER_FEMALE if Q.FEMALE in genders else 0)
+
+    if P.NATIONALITY not in claims:
+        nationality = NATIONALITY_NONE
+    elif Q.TAIWAN in _item_ids(content, P.NATIONALITY):
+        nationality = NATIONALITY_TAIWAN
+    else:
+        nationality = NATIONALITY_OTHER
+
+    return EntityFeatures(
+        id=content['id'],
+        label=get_label_fallback_LanguageDict(labels, FALLBACK_CHAIN_ZHTW),
+        has_instance_of=P.INSTANCE_OF in claims,
+        human=Q.HUMAN in _item_ids(content, P.INSTANCE_OF),
+        birth_date=birth_date,
+        birth_precision=birth_precision,
+        gender=gender,
+        nationality=nationality,
+        politician=Q.POLITICIAN in _item_ids(content, P.OCCUPATION),
+        party=P.PARTY_MEMBERSHIP in claims,
+        cbdb=P.CBDB_ID in claims,
+    )
+
+
+def page_features(page, P=PropertyIds, Q=ItemIds) -> EntityFeatures:
+    """Features of a loaded ItemPage, including edits not saved yet."""
+    content = page.toJSON()
+    content['id'] = page.getID()
+    return entity_features(content, P, Q)
+
+
+class MatchTable():
+    """Candidate/search hit pairs, scored in one array pass.
+
+    Every pair keeps its hit's features and its candidate's name, birth date and gender
+    as numpy columns, so confidences and best matches (for any threshold) can be
+    recomputed for a whole election without fetching anything again.
+    """
+
+    HIT_COLUMNS = ['label', 'has_instance_of', 'human', 'birth_date', 'birth_precision',
+                   'gender', 'nationality', 'politician', 'party', 'cbdb']
+    CANDIDATE_COLUMNS = ['cand_name', 'cand_birth_date', 'cand_birth_precision', 'cand_gender']
+
+    def __init__(self, columns:Dict[str, np.ndarray], n_candidates:int):
+        self.columns = columns
+        self.n_candidates = n_candidates
+        self.confidence = pair_confidences(columns)
+
+    @classmethod
+    def from_pairs(cls, candidates:Sequence, pairs:Sequence[Tuple[int, EntityFeatures]]):
+        """Pairs are (position of the candidate in candidates, features of the hit)."""
+        cand_index = np.array([i for i, _ in pairs], dtype=np.int64)
+        hits = [f for _, f in pairs]
+        columns = {
+            'cand_index': cand_index,
+            'id': np.array([f.id for f in hits], dtype=object),
+            'label': np.array([f.label for f in hits], dtype=object),
+            'has_instance_of': np.array([f.has_instance_of for f in hits], dtype=bool),
+            'human': np.array([f.human for f in hits], dtype=bool),
+            'birth_date': np.array([f.birth_date for f in hits], dtype=np.int64),
+            'birth_precision': np.array([f.birth_precision for f in hits], dtype=np.int8),
+            'gender': np.array([f.gender for f in hits], dtype=np.int8),
+            'nationality': np.array([f.nationality for f in hits], dtype=np.int8),
+            'politician': np.array([f.politician for f in hits], dtype=bool),
+            'party': np.array([f.party for f in hits], dtype=bool),
+            'cbdb': np.array([f.cbdb for f in hits], dtype=bool),
+            'cand_name': np.array([c.legal_name for c in candidates], dtype=object)[cand_index],
+            'cand_birth_date': np.array([c.birth_date_value for c in candidates], dtype=np.int64)[cand_index],
+            'cand_birth_precision': np.array([c.birth_date_precision for c in candidates], dtype=np.int8)[cand_index],
+            'cand_gender': np.array([c.gender.value for c in candidates], dtype=np.int8)[cand_index],
+        }
+        return cls(columns, len(candidates))
+
+    @classmethod
+    def concat(cls, tables:Sequence['MatchTable']):
+        """One table for several batches; candidate positions continue from one table to the next."""
+        if len(tables) == 0:
+            return cls.from_pairs([], [])
+        offsets = np.cumsum([0] + [t.n_candidates for t in tables])
+        columns = {
+            name: np.concatenate([t.columns[name] for t in tables])
+            for name in ['id', *cls.HIT_COLUMNS, *cls.CANDIDATE_COLUMNS]
+        }
+        columns['cand_index'] = np.concatenate(
+            [t.columns['cand_index'] + offset for t, offset in zip(tables, offsets)])
+        return cls(columns, int(offsets[-1]))
+
+    def __len__(self):
+        return len(self.confidence)
+
+    def candidate_confidences(self) -> List[Dict[str, float]]:
+        """Confidence of each hit, for every candidate."""
+        confidences = [dict() for _ in range(self.n_candidates)]
+        for i, id, confidence in zip(self.columns['cand_index'], self.columns['id'], self.confidence):
+            confidences[i][id] = float(confidence)
+        return confidences
+
+    def best_matches(self, min_confidence=1) -> List[Optional[str]]:
+        """ID of the most confident hit of every candidate, None if no hit reaches min_confidence."""
+        ok = self.confidence >= min_confidence
+        df = pd.DataFrame({
+            'cand': self.columns['cand_index'][ok],
+            'id': self.columns['id'][ok],
+            'confidence': self.confidence[ok],
+        })
+        best = df[df['confidence'] == df.groupby('cand')['confidence'].transform('max')]
+        if best['cand'].duplicated().any():
+            raise ValueError('multiple results with same confidence')
+
+        best_ids = [None] * self.n_candidates
+        for cand, id in zip(best['cand'], best['id']):
+            best_ids[cand] = id
+        return best_ids
+
+
+def pair_confidences(columns:Dict[str, np.ndarray]) -> np.ndarray:
+    """same_person_confidence of every pair in MatchTable columns."""
+    c = columns
+    confidence = np.ones(len(c['id']))
+
+    has_birth_date = c['birth_precision'] != 0
+    birth_dates_match = dates_match(c['birth_date'], c['birth_precision'],
+                                    c['cand_birth_date'], c['cand_birth_precision'])
+    precision = np.minimum(c['birth_precision'], c['cand_birth_precision']).astype(np.int64)
+    confidence += np.where(has_birth_date, precision - WbTimePrecision.YEAR + 1, 0)
+
+    is_male = (c['gender'] & GENDER_MALE) != 0
+    is_female = (c['gender'] & GENDER_FEMALE) != 0
+    same_gender = np.where(c['cand_gender'] == Gender.MALE.value, is_male, is_female)
+    other_gender = np.where(c['cand_gender'] == Gender.MALE.value, is_female, is_male)
+    confidence += 0.5 * same_gender - 0.5 * other_gender
+
+    confidence += np.select([c['nationality'] == NATIONALITY_TAIWAN, c['nationality'] == NATIONALITY_OTHER],
+                            [0.5, -1], 0)
+    confidence += 0.5 * c['politician']
+    confidence += 0.1 * c['party']
+
+    rejected = ((c['label'] != c['cand_name'])
+                | c['cbdb']
+                | (c['has_instance_of'] & ~c['human'])
+                | (has_birth_date & ~birth_dates_match))
+    return np.where(rejected, 0, confidence)
+
+
+def features_confidence(features:EntityFeatures, cand) -> float:
+    """same_person_confidence computed from EntityFeatures."""
+    return float(MatchTable.from_pairs([cand], [(0, features)]).confidence[0])
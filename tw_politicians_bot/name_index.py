@@ -0,0 +1,124 @@
+import bz2
+import gzip
+import json
+import sqlite3
+import sys
+from typing import Dict, Iterable, Iterator, List
+
+from .entity_ids import ItemIds, PropertyIds
+from .matching import EntityFeatures, entity_features
+
+
+NAME_INDEX_FILENAME = 'name_index.sqlite'
+
+
+def open_dump(filename):
+    if str(filename).endswith('.bz2'):
+        return bz2.open(filename, 'rt', encoding='utf-8')
+    if str(filename).endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding='utf-8')
+    return open(filename, 'r', encoding='utf-8')
+
+
+def iter_dump_entities(filename) -> Iterator[dict]:
+    """Entities of a Wikidata JSON dump (one entity per line inside a JSON array), one at a time.
+
+    A line that is not valid JSON, like the torn last line of a dump cut off while downloading, is skipped.
+    """
+    with open_dump(filename) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip().rstrip(',')
+            if line in ('', '[', ']'):
+                continue
+            try:
+                content = json.loads(line)
+            except json.JSONDecodeError:
+                print(f'skipped line {line_number}: not a complete entity')
+                continue
+            yield content
+
+
+def is_indexed_human(content:dict) -> bool:
+    if content.get('type') != 'item':
+        return False
+    instance_of = content.get('claims', {}).get(PropertyIds.INSTANCE_OF, [])
+    return any(claim.get('mainsnak', {}).get('datavalue', {}).get('value', {}).get('id') == ItemIds.HUMAN
+               for claim in instance_of)
+
+
+class NameIndex():
+    """Label -> matching features of humans, built from a Wikidata dump for offline candidate matching.
+
+    Only the label same_person_confidence compares (zh-tw, then zh-hant, then zh) is indexed.
+    IDs are main-site (www.wikidata.org) IDs.
+    """
+
+    def __init__(self, filename=NAME_INDEX_FILENAME):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS entities ('
+                              'id TEXT PRIMARY KEY, label TEXT NOT NULL, has_instance_of INTEGER, human INTEGER, '
+                              'birth_date INTEGER, birth_precision INTEGER, gender INTEGER, nationality INTEGER, '
+                              'politician INTEGER, party INTEGER, cbdb INTEGER)')
+
+    def close(self):
+        self.conn.close()
+
+    def add_many(self, features:Iterable[EntityFeatures]):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [tuple(f) for f in features])
+
+    def create_label_index(self):
+        with self.conn:
+            self.conn.execute('CREATE INDEX IF NOT EXISTS entities_label ON entities (label)')
+
+    def lookup(self, label:str) -> List[EntityFeatures]:
+        return self.lookup_many([label]).get(label, [])
+
+    def lookup_many(self, labels:Iterable[str]) -> Dict[str, List[EntityFeatures]]:
+        labels = list(dict.fromkeys(labels))
+        found = {label: [] for label in labels}
+        for i in range(0, len(labels), 500):
+            group = labels[i:i+500]
+            placeholders = ','.join('?' * len(group))
+            rows = self.conn.execute(f'SELECT * FROM entities WHERE label IN ({placeholders}) ORDER BY id', group)
+            for row in rows:
+                id, label, has_instance_of, human, birth_date, birth_precision, gender, nationality, *flags = row
+                features = EntityFeatures(id, label, bool(has_instance_of), bool(human), birth_date, birth_precision,
+                                          gender, nationality, *(bool(flag) for flag in flags))
+                found[features.label].append(features)
+        return found
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+
+def build_name_index(dump_filename, index_filename=NAME_INDEX_FILENAME, batch_size=10000) -> NameIndex:
+    """Stream a (compressed) JSON dump and keep every human with a zh-tw, zh-hant or zh label."""
+    index = NameIndex(index_filename)
+    batch = []
+    scanned = 0
+    for content in iter_dump_entities(dump_filename):
+        scanned += 1
+        if is_indexed_human(content):
+            features = entity_features(content)
+            if features.label is not None:
+                batch.append(features)
+        if len(batch) >= batch_size:
+            index.add_many(batch)
+            batch = []
+        if scanned % 1000000 == 0:
+            print(f'scanned {scanned} entities')
+    index.add_many(batch)
+    index.create_label_index()
+    print(f'indexed {len(index)} of {scanned} entities')
+    return index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print('usage: python -m tw_politicians_bot.name_index <dump.json[.bz2|.gz]> [name_index.sqlite]')
+        sys.exit(1)
+    build_name_index(*sys.argv[1:])
@@ -0,0 +1,156 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+SEARCH_CACHE_FILENAME = 'search_cache.sqlite'
+
+SearchKey = Tuple[str, str, str, str]   # (sitename, text, language, type)
+
+
+class SearchCache():
+    """search_entities results, in an in-memory LRU over a SQLite file.
+
+    Entries are keyed by site, search text, language and entity type and expire `ttl`
+    seconds after they were fetched. The file keeps at most `max_entries` entries,
+    evicting the least recently used ones; the memory layer keeps `memory_entries`.
+    A cached search answers any request for up to as many results as it was made with.
+    Use times of hits are written in batches of `used_batch`.
+    """
+
+    def __init__(self, filename=SEARCH_CACHE_FILENAME, ttl=7*24*3600, max_entries=200000, memory_entries=10000,
+                 used_batch=100):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.used_batch = used_batch
+        self.lock = threading.Lock()
+        self.memory:OrderedDict[SearchKey, Tuple[float, int, List[dict]]] = OrderedDict()
+        self.used:Dict[SearchKey, float] = dict()     # hits whose used_at is not written yet
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS searches ('
+                              'site TEXT NOT NULL, text TEXT NOT NULL, language TEXT NOT NULL, type TEXT NOT NULL, '
+                              'lim INTEGER NOT NULL, fetched_at REAL NOT NULL, used_at REAL NOT NULL, '
+                              'json TEXT NOT NULL, PRIMARY KEY (site, text, language, type))')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS searches_used_at ON searches (used_at)')
+        self.count = self.conn.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            with self.conn:
+                self._write_used()
+            self.conn.close()
+            self.conn = None
+
+    def get(self, key:SearchKey, limit:int) -> Optional[List[dict]]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                row = self.conn.execute('SELECT fetched_at, lim, json FROM searches '
+                                        'WHERE site = ? AND text = ? AND language = ? AND type = ?', key).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], json.loads(row[2]))
+            if entry is None or now - entry[0] > self.ttl or entry[1] < limit:
+                self.misses += 1
+                return None
+
+            self._remember(key, entry)
+            self.used[key] = now
+            if len(self.used) >= self.used_batch:
+                with self.conn:
+                    self._write_used()
+            self.hits += 1
+            return entry[2][:limit]
+
+    def put(self, key:SearchKey, limit:int, results:List[dict]):
+        now = time.time()
+        entry = (now, limit, results)
+        with self.lock:
+            self._remember(key, entry)
+            self.used.pop(key, None)
+            with self.conn:
+                exists = self.conn.execute('SELECT 1 FROM searches '
+                                           'WHERE site = ? AND text = ? AND language = ? AND type = ?', key).fetchone()
+                self.conn.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  (*key, limit, now, now, json.dumps(results, ensure_ascii=False)))
+                if exists is None:
+                    self.count += 1
+                if self.count > self.max_entries:
+                    self._evict()
+
+    def invalidate(self, site:str, text:str):
+        """Forget every search of `text` on the site, e.g. after creating an item with that label."""
+        with self.lock:
+            for key in [key for key in self.memory if key[0] == site and key[1] == text]:
+                del self.memory[key]
+            for key in [key for key in self.used if key[0] == site and key[1] == text]:
+                del self.used[key]
+            with self.conn:
+                deleted = self.conn.execute('DELETE FROM searches WHERE site = ? AND text = ?', (site, text))
+                self.count -= deleted.rowcount
+
+    def _write_used(self):
+        self.conn.executemany('UPDATE searches SET used_at = ? '
+                              'WHERE site = ? AND text = ? AND language = ? AND type = ?',
+                              [(used_at, *key) for key, used_at in self.used.items()])
+        self.used.clear()
+
+    def _evict(self):
+        # Down to 90% of max_entries, so the scan runs once per many puts
+        self._write_used()
+        keep = self.max_entries * 9 // 10
+        deleted = self.conn.execute('DELETE FROM searches WHERE rowid IN ('
+                                    'SELECT rowid FROM searches ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (keep,))
+        self.count -= deleted.rowcount
+
+    def _remember(self, key:SearchKey, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+
+
+def search_entities(site, text:str, language:str, limit:int, type='item') -> List[dict]:
+    """site.search_entities as a list, answered from the default cache when there is one."""
+    cache = DEFAULT_CACHE
+    if cache is None:
+        return list(site.search_entities(text, language, limit, type=type))
+
+    key = (site.sitename, text, language, type)
+    results = cache.get(key, limit)
+    if results is None:
+        results = list(site.search_entities(text, language, limit, type=type))
+        cache.put(key, limit, results)
+    return results
+
+
+def forget_searches(site, text:str):
+    """Drop cached searches of `text`, whose results change once an item with that label is created."""
+    if DEFAULT_CACHE is not None:
+        DEFAULT_CACHE.invalidate(site.sitename, text)
+
+
+DEFAULT_CACHE:Optional[SearchCache] = None
+
+
+def open_default_cache(filename=SEARCH_CACHE_FILENAME, **kwargs) -> SearchCache:
+    global DEFAULT_CACHE
+    if DEFAULT_CACHE is None or DEFAULT_CACHE.filename != filename:
+        DEFAULT_CACHE = SearchCache(filename, **kwargs)
+        atexit.register(DEFAULT_CACHE.close)
+    return DEFAULT_CACHE
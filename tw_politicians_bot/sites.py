@@ -0,0 +1,20 @@
+from functools import lru_cache
+
+from pywikibot import Site
+from pywikibot.site import DataSite
+
+
+MAIN_SITENAME = 'wikidata:wikidata'
+TEST_SITENAME = 'wikidata:test'     # pywikibot sitename is family:code
+
+
+# Created on first use, so importing the package does not set up any site
+
+@lru_cache(maxsize=None)
+def main_site() -> DataSite:
+    return Site('wikidata', 'wikidata')
+
+
+@lru_cache(maxsize=None)
+def test_site() -> DataSite:
+    return Site('test', 'wikidata')
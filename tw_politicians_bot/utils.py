@@ -1,4 +1,5 @@
-from typing import Sequence
+import itertools
+from typing import Iterable, List, Sequence
 
 
 def options_interface(description,
@@ -48,3 +49,12 @@ def _str_width(s: str):
         else:
             width += 2
     return width
+
+
+def batched(iterable:Iterable, n:int) -> Iterable[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, n))
+        if len(batch) == 0:
+            return
+        yield batch
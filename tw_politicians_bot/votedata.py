@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Union
+
+import pandas as pd
+
+from .election_data import ElectionData
+
+
+ELECTION_FILES = ('elbase.csv', 'elcand.csv', 'elctks.csv')
+DISTRICT_TYPE_DIR_NAMES = ['區域立委', '山地立委', '平地立委']
+
+DistrictTypeOption = Union[str, Callable[[Path], str]]
+
+
+def find_election_dirs(root) -> List[Path]:
+    """Every directory under root that holds an elbase/elcand/elctks triple."""
+    root = Path(root)
+    dirs = {path.parent for path in root.rglob(ELECTION_FILES[1])}
+    return sorted(d for d in dirs if all((d/filename).is_file() for filename in ELECTION_FILES))
+
+
+def guess_district_type(rel_dir:Path) -> str:
+    """District type named by the folder, e.g. `20120114-總統及立委/山地立委`; '其他' otherwise."""
+    for part in reversed(rel_dir.parts):
+        if part in DISTRICT_TYPE_DIR_NAMES:
+            return part
+    return '其他'
+
+
+def _load_candidates_df(dir_name, district_type, chunksize, cache) -> pd.DataFrame:
+    return ElectionData(dir_name, district_type, chunksize=chunksize, cache=cache, keep_frames=True).candidates_df
+
+
+def load_votedata_tree(root,
+                       district_type:DistrictTypeOption = guess_district_type,
+                       max_workers=None,
+                       chunksize=None,
+                       cache=True,
+                       skip_errors=False) -> pd.DataFrame:
+    """Load every election under an extracted votedata.zip into one candidate table.
+
+    Directories are parsed in a process pool (one process per core by default).
+    Each row is tagged with `election` (the top-level folder, e.g. 20120114-總統及立委),
+    `district_dir` (the path below it) and the `district_type` it was loaded with.
+    `district_type` is either a fixed type or a function of the directory relative to root.
+    """
+    root = Path(root)
+    dirs = find_election_dirs(root)
+    rel_dirs = [d.relative_to(root) for d in dirs]
+    if callable(district_type):
+        district_types = [district_type(rel_dir) for rel_dir in rel_dirs]
+    else:
+        district_types = [district_type] * len(dirs)
+
+    tables = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_load_candidates_df, d, t, chunksize, cache) for d, t in zip(dirs, district_types)]
+        for rel_dir, dtype, future in zip(rel_dirs, district_types, futures):
+            try:
+                df = future.result()
+            except Exception as err:
+                if not skip_errors:
+                    raise
+                print(f'略過 {rel_dir}: {err}')
+                continue
+            df.insert(0, 'election', rel_dir.parts[0])
+            df.insert(1, 'district_dir', '/'.join(rel_dir.parts[1:]))
+            df.insert(2, 'district_type', dtype)
+            tables.append(df)
+
+    if len(tables) == 0:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True)
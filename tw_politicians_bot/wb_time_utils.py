@@ -1,6 +1,7 @@
 from enum import IntEnum
 import re
 
+import numpy as np
 from pywikibot import WbTime
 
 
@@ -23,11 +24,37 @@ WB_TIME_REGEX = r"([-+]?\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)Z"
 
 
 def time_match(time1:WbTime, time2:WbTime):
-    precision = min(time1.precision, time2.precision)
-    if precision >= WbTimePrecision.YEAR and time1.year != time2.year:
-        return False
-    if precision >= WbTimePrecision.MONTH and time1.month != time2.month:
-        return False
-    if precision >= WbTimePrecision.DAY and time1.day != time2.day:
-        return False
-    return True
+    return bool(dates_match(*encode_wbtime(time1), *encode_wbtime(time2)))
+
+
+# Dates are also handled as integers yyyymmdd (month and day are 0 below
+# their precision) next to a WbTimePrecision value, so whole columns of
+# dates can be compared without creating WbTime objects.
+
+def encode_date(year, month=0, day=0):
+    return year * 10000 + month * 100 + day
+
+
+def encode_wbtime(time:WbTime):
+    month = time.month if time.precision >= WbTimePrecision.MONTH else 0
+    day = time.day if time.precision >= WbTimePrecision.DAY else 0
+    return encode_date(time.year, month, day), time.precision
+
+
+def decode_wbtime(value:int, precision:int) -> WbTime:
+    year, month, day = value // 10000, value // 100 % 100, value % 100
+    return WbTime(year,
+                  month if precision >= WbTimePrecision.MONTH else None,
+                  day if precision >= WbTimePrecision.DAY else None,
+                  precision=int(precision))
+
+
+def dates_match(value1, precision1, value2, precision2):
+    """Integer-encoded counterpart of time_match, elementwise on numpy arrays."""
+    precision = np.minimum(precision1, precision2)
+    unit = np.select([precision >= WbTimePrecision.DAY,
+                      precision >= WbTimePrecision.MONTH,
+                      precision >= WbTimePrecision.YEAR],
+                     [1, 100, 10000], 0)
+    safe_unit = np.where(unit == 0, 1, unit)
+    return (unit == 0) | (np.floor_divide(value1, safe_unit) == np.floor_divide(value2, safe_unit))
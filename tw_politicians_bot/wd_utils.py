@@ -1,4 +1,5 @@
-from typing import List, Union, Mapping
+from collections import defaultdict
+from typing import Dict, Iterable, List, Union, Mapping
 
 from pywikibot import (
     ItemPage,
@@ -8,6 +9,8 @@ from pywikibot import (
     WbQuantity,
 )
 
+from . import entity_store
+
 
 ClaimsDict = Mapping[str, List[Claim]]
 DataType = Union[str, ItemPage, PropertyPage, WbTime, WbQuantity]
@@ -49,3 +52,42 @@ def set_claim(claims:ClaimsDict, site, prop, value:DataType,
     new_claim = make_claim(site, prop, value, is_reference=is_reference, is_qualifier=is_qualifier, **kargs)
     claims.setdefault(prop, []).append(new_claim)
     return new_claim
+
+
+def add_sources(claim:Claim, sources:List[Claim]):
+    """Claim.addSources without the editSource call it makes for a claim loaded from an item.
+
+    The sources are only attached in memory and are saved with the next edit of the entity.
+    """
+    source = defaultdict(list)
+    for source_claim in sources:
+        source_claim.isReference = True
+        source[source_claim.getID()].append(source_claim)
+    claim.sources.append(source)
+
+
+def fetch_entities(site, ids:Iterable[str], groupsize=50, executor=None) -> Dict[str, ItemPage]:
+    """Load items with one wbgetentities call per `groupsize` IDs, optionally running the calls on an executor.
+
+    With an entity store open, cached entities are only revalidated and the stale ones fetched.
+    """
+    ids = list(dict.fromkeys(ids))
+    if entity_store.DEFAULT_STORE is not None:
+        contents = entity_store.DEFAULT_STORE.load(site, ids, executor=executor)
+        return {id: entity_store.entity_page(site, content) for id, content in contents.items()}
+
+    groups = [ids[i:i+groupsize] for i in range(0, len(ids), groupsize)]
+
+    def fetch_group(group):
+        return list(site.preload_entities([ItemPage(site, id) for id in group], groupsize=groupsize))
+
+    if executor is None:
+        results = map(fetch_group, groups)
+    else:
+        results = executor.map(fetch_group, groups)
+
+    items = dict()
+    for pages in results:
+        for page in pages:
+            items[page.getID()] = page
+    return items
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from pywikibot.exceptions import APIError, MaxlagTimeoutError, ServerError
+try:
+    from pywikibot.exceptions import ApiTimeoutError
+except ImportError:     # pywikibot < 11.5
+    from pywikibot.exceptions import TimeoutError as ApiTimeoutError
+
+
+T = TypeVar('T')
+
+THROTTLE_CODES = {'maxlag', 'ratelimited', 'actionthrottledtext', 'readonly'}
+
+
+def throttle_delay(err:Exception) -> Optional[float]:
+    """Seconds the server asked to wait for a throttling error (0 if it did not say); None for other errors.
+
+    A throttled write was refused, so it can always be sent again.
+    """
+    if isinstance(err, APIError) and err.code in THROTTLE_CODES:
+        lag = err.other.get('lag') if isinstance(getattr(err, 'other', None), dict) else None
+        return float(lag) if lag is not None else 0.0
+    if isinstance(err, MaxlagTimeoutError):
+        return 0.0
+    return None
+
+
+def outcome_unknown(err:Exception) -> bool:
+    """Whether the write may have been saved despite the error: a server error (5xx) or a timeout."""
+    return isinstance(err, (ServerError, ApiTimeoutError)) and not isinstance(err, MaxlagTimeoutError)
+
+
+class TokenBucket():
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate:float, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.not_before = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds:float):
+        """Hold every acquisition for at least `seconds` from now."""
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.not_before:
+                    wait = self.not_before - now
+                elif self.rate == float('inf'):
+                    return
+                else:
+                    refill_from = max(self.updated, self.not_before)
+                    self.tokens = min(self.capacity, self.tokens + (now - refill_from) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class WriteScheduler():
+    """Paces write requests with a token bucket that adapts to the server.
+
+    The interval between writes starts at `max_interval` and shrinks by 10% after every
+    successful write down to `min_interval`; a throttling error (maxlag, rate limit, ...)
+    doubles it again, pauses all writes for the time the server asked for or an
+    exponential backoff with jitter, and puts the item back in the queue. Items are
+    given up after `max_retries` throttled attempts.
+
+    A write whose outcome is unknown (see outcome_unknown) may have been saved, so it is
+    only retried the same way when `retry_unknown(item)` says sending it twice is harmless.
+    """
+
+    def __init__(self, max_interval=1.0, min_interval=None, max_retries=5, base_backoff=5.0, max_backoff=600.0):
+        self.max_interval = max_interval
+        self.min_interval = max_interval / 10 if min_interval is None else min(min_interval, max_interval)
+        self.interval = max_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(self._rate())
+        self.throttled = 0
+
+    def _rate(self):
+        return 1 / self.interval if self.interval > 0 else float('inf')
+
+    def _set_interval(self, interval:float):
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        self.bucket.rate = self._rate()
+
+    def succeeded(self):
+        self._set_interval(self.interval * 0.9)
+
+    def backoff(self, attempt:int, server_delay:float) -> float:
+        """Pause writes after a throttling or server error on the attempt-th try; returns the pause in seconds."""
+        self.throttled += 1
+        self._set_interval(max(self.interval * 2, self.min_interval))
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        delay = max(server_delay, backoff / 2 + random.uniform(0, backoff / 2))
+        self.bucket.pause(delay)
+        return delay
+
+    def run_one(self, write:Callable[[], Optional[Exception]]) -> Optional[Exception]:
+        """Paced and retried like one item of run, errors of unknown outcome excepted; returns the final error."""
+        for _, err in self.run([None], lambda _: write()):
+            return err
+
+    def run(self, items:Iterable[T], write:Callable[[T], Optional[Exception]],
+            retry_unknown:Callable[[T], bool]=None) -> Iterator[Tuple[T, Optional[Exception]]]:
+        """Write every item, yielding it with its final error (None once written)."""
+        items = iter(items)
+        retries = deque()   # (item, attempts so far)
+        while True:
+            if retries:
+                item, attempt = retries.popleft()
+            else:
+                try:
+                    item, attempt = next(items), 0
+                except StopIteration:
+                    return
+
+            self.bucket.acquire()
+            err = write(item)
+            if err is None:
+                self.succeeded()
+                yield item, None
+                continue
+
+            server_delay = throttle_delay(err)
+            repeat = (server_delay is None and outcome_unknown(err)
+                      and retry_unknown is not None and retry_unknown(item))
+            if (server_delay is None and not repeat) or attempt >= self.max_retries:
+                yield item, err
+                continue
+
+            delay = self.backoff(attempt, server_delay or 0.0)
+            reason = '伺服器錯誤' if repeat else '伺服器要求降速'
+            print(f'{reason}，{delay:.1f} 秒後重試（第 {attempt + 1} 次）')
+            retries.append((item, attempt + 1))
@@ -4,4 +4,8 @@ mylang = 'wikidata'
 usernames['wikidata']['test'] = 'TwPoliticiansBot'
 usernames['wikidata']['wikidata'] = 'TwPoliticiansBot'
 
-console_encoding = 'utf-8'
\ No newline at end of file
+console_encoding = 'utf-8'
+# Every write is paced by tw_politicians_bot.write_scheduler (-s sets the longest interval for
+# candidates; AdaptiveEntity paces the entities it creates). Nothing may write outside of it:
+# references are attached in memory (wd_utils.add_sources) and saved with the item's edit
+put_throttle = 0